@@ -0,0 +1,361 @@
+"""
+복순이 제작소 - 명령어 부하 테스트
+
+디스코드 없이 가짜 인터랙션/멤버/길드로 main.py의 명령어 코루틴을 동시에 실행하고
+지연 시간(p50/p95/p99), 명령어당 DB 요청 수, 명령어당 REST 호출 수를 잰다.
+
+python bench.py --moderators 20 --commands 25 --scenario all --storage memory
+(--storage mongo는 DBCLIENT, 없으면 로컬 mongod에 붙고 벤치용 DB는 끝나면 지운다)
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+
+from pymongo import monitoring
+
+os.environ.setdefault("DBCLIENT", "mongodb://localhost:27017/?serverSelectionTimeoutMS=3000")
+os.environ.setdefault("DBNAME", "Boksun_bench")
+os.environ.setdefault("LOG_JOURNAL_PATH", os.path.join(tempfile.gettempdir(), "boksun_bench.journal"))
+
+
+# main을 불러오기 전에 등록해야 main의 클라이언트에도 붙는다
+class DBOpCounter(monitoring.CommandListener):
+    IGNORED = {'hello', 'isMaster', 'ismaster', 'endSessions', 'ping'}
+
+    def __init__(self):
+        self.ops = Counter()
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED:
+            self.ops[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+db_ops = DBOpCounter()
+monitoring.register(db_ops)
+
+import disnake  # noqa: E402
+
+GUILD_ID = 900000000000000000
+main = None
+store_ops = Counter()
+rest_calls = Counter()
+rest_latency = 0.0
+
+
+def load_main(storage: str):
+    # 저장소 종류는 main을 불러올 때 정해지므로 인자를 본 뒤에 불러온다
+    global main
+    os.environ["STORAGE_BACKEND"] = storage
+    os.environ.setdefault("STORAGE_PATH", os.path.join(tempfile.gettempdir(), "boksun_bench.sqlite3"))
+    import main as loaded
+    main = loaded
+
+    def counted(name, method):
+        def wrapper(*args, **kwargs):
+            store_ops[name] += 1
+            return method(*args, **kwargs)
+        return wrapper
+
+    # 저장소 메서드 호출 수를 센다 (Mongo는 실제 요청 수도 따로 센다)
+    for name in dir(main.store):
+        if not name.startswith('_') and callable(getattr(main.store, name)):
+            setattr(main.store, name, counted(name, getattr(main.store, name)))
+
+
+async def rest(name: str):
+    rest_calls[name] += 1
+    if rest_latency:
+        await asyncio.sleep(rest_latency)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str = "role", managed: bool = False):
+        self.id = role_id
+        self.name = name
+        self.managed = managed
+        self.mention = f"<@&{role_id}>"
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, *args, **kwargs):
+        await rest('user.send')
+
+
+class FakeMember(FakeUser):
+    def __init__(self, user_id: int, name: str, guild: "FakeGuild", roles: List[FakeRole]):
+        super().__init__(user_id, name)
+        self.guild = guild
+        self.roles = roles
+        self.current_timeout = None
+        self.guild_permissions = disnake.Permissions.none()
+
+    async def edit(self, roles: List[FakeRole] = None, reason: str = None, **kwargs):
+        await rest('member.edit')
+        if roles is not None:
+            self.roles = list(roles)
+
+    async def timeout(self, until=None, duration=None, reason: str = None):
+        await rest('member.timeout')
+        self.current_timeout = until
+
+    async def kick(self, reason: str = None):
+        await rest('member.kick')
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, roles: List[FakeRole]):
+        self.id = guild_id
+        self.name = "bench"
+        self.shard_id = 0
+        self._roles = {role.id: role for role in roles}
+        self._members: Dict[int, FakeMember] = {}
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self._members.values())
+
+    def add_member(self, member: FakeMember):
+        self._members[member.id] = member
+
+    def get_role(self, role_id: int):
+        return self._roles.get(role_id)
+
+    def get_member(self, user_id: int):
+        return self._members.get(user_id)
+
+    async def fetch_member(self, user_id: int):
+        await rest('guild.fetch_member')
+        member = self._members.get(user_id)
+        if member is None:
+            raise disnake.NotFound(FakeHTTPResponse(404), "Unknown Member")
+        return member
+
+    async def ban(self, user, reason: str = None, **kwargs):
+        await rest('guild.ban')
+
+    async def unban(self, user, reason: str = None):
+        await rest('guild.unban')
+
+    async def fetch_ban(self, user):
+        await rest('guild.fetch_ban')
+        raise disnake.NotFound(FakeHTTPResponse(404), "Unknown Ban")
+
+
+class FakeHTTPResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "bench"
+        self.headers = {}
+
+
+class FakeResponse:
+    def __init__(self):
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, ephemeral: bool = False, **kwargs):
+        await rest('response.defer')
+        self._done = True
+
+    async def send_message(self, *args, **kwargs):
+        await rest('response.send_message')
+        self._done = True
+
+
+class FakeFollowup:
+    async def send(self, *args, **kwargs):
+        await rest('followup.send')
+
+
+class FakeCommand:
+    def __init__(self, name: str):
+        self.qualified_name = name
+
+
+class FakeInteraction:
+    def __init__(self, command: str, author: FakeMember, guild: FakeGuild):
+        self.application_command = FakeCommand(command)
+        self.author = author
+        self.guild = guild
+        self.guild_id = guild.id
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+def build_guild(moderators: int, targets: int):
+    config = main.guild_configs.get(GUILD_ID)
+    admin_role = FakeRole(next(iter(config.admin_role_ids)), "admin")
+    mute_role = FakeRole(config.mute_role_id, "mute")
+    plain_roles = [FakeRole(1000 + i, f"role{i}") for i in range(8)]
+    booster = FakeRole(2000, "booster", managed=True)
+    guild = FakeGuild(GUILD_ID, [admin_role, mute_role, booster, *plain_roles])
+    mods = [FakeMember(10_000 + i, f"mod{i}", guild, [admin_role]) for i in range(moderators)]
+    members = []
+    for i in range(targets):
+        roles = random.sample(plain_roles, 3) + ([booster] if i % 10 == 0 else [])
+        members.append(FakeMember(100_000 + i, f"user{i}", guild, roles))
+    for member in mods + members:
+        guild.add_member(member)
+    return guild, mods, members
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def scenario_calls(scenario: str, mod: FakeMember, members: List[FakeMember], count: int, index: int):
+    # (명령어 이름, 콜백, 인자) 목록
+    if scenario == 'warn':
+        return [("경고", main.warn.callback, (random.choice(members), "부하 테스트")) for _ in range(count)]
+    if scenario == 'mute':
+        return [("재갈", main.mute.callback, (random.choice(members), "10m", "부하 테스트")) for _ in range(count)]
+    if scenario == 'log':
+        kinds = ["전체", "경고", "재갈"]
+        return [("로그", main.log.callback, (random.choice(members), random.choice(kinds))) for _ in range(count)]
+    if scenario == 'escalation':
+        # 모더레이터마다 한 명에게 경고를 몰아서 재갈 -> 추방 -> 사형까지 이어지게 한다
+        target = members[index % len(members)]
+        return [("경고", main.warn.callback, (target, "누적 테스트")) for _ in range(count)]
+    raise ValueError(scenario)
+
+
+async def run_scenario(scenario: str, guild: FakeGuild, mods: List[FakeMember], members: List[FakeMember],
+                       count: int) -> Dict:
+    latencies: List[float] = []
+    db_ops.ops.clear()
+    store_ops.clear()
+    rest_calls.clear()
+
+    async def moderator(index: int, mod: FakeMember):
+        for name, callback, args in scenario_calls(scenario, mod, members, count, index):
+            inter = FakeInteraction(name, mod, guild)
+            started = time.perf_counter()
+            await callback(inter, *args)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    # 명령어마다 찍는 로그는 결과 표를 가리므로 버린다
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(moderator(i, mod) for i, mod in enumerate(mods)))
+        # write-behind로 밀린 기록까지 DB 요청 수에 넣는다
+        await main.log_writer.flush()
+    elapsed = time.perf_counter() - started
+
+    commands = len(latencies)
+    return {
+        'scenario': scenario,
+        'commands': commands,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'store_per_cmd': sum(store_ops.values()) / commands,
+        'db_per_cmd': sum(db_ops.ops.values()) / commands,
+        'rest_per_cmd': sum(rest_calls.values()) / commands,
+        'cmd_per_s': commands / elapsed,
+        'store_ops': dict(store_ops),
+        'db_ops': dict(db_ops.ops),
+        'rest_calls': dict(rest_calls),
+    }
+
+
+def print_results(results: List[Dict], verbose: bool):
+    header = (f"{'시나리오':<12}{'명령':>7}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}"
+              f"{'저장소/명령':>10}{'Mongo/명령':>11}{'REST/명령':>11}{'명령/s':>9}")
+    print(header)
+    for r in results:
+        print(f"{r['scenario']:<14}{r['commands']:>7}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+              f"{r['store_per_cmd']:>13.2f}{r['db_per_cmd']:>12.2f}{r['rest_per_cmd']:>12.2f}{r['cmd_per_s']:>9.0f}")
+        if verbose:
+            print(f"    저장소: {r['store_ops']}")
+            print(f"    Mongo: {r['db_ops']}")
+            print(f"    REST: {r['rest_calls']}")
+
+
+def remove_sqlite_files():
+    for suffix in ("", "-wal", "-shm"):
+        with contextlib.suppress(OSError):
+            os.remove(os.environ["STORAGE_PATH"] + suffix)
+
+
+async def run(args):
+    global rest_latency
+    rest_latency = args.rest_latency / 1000
+    random.seed(args.seed)
+    if args.storage == 'mongo':
+        try:
+            await main.client.admin.command('ping')
+        except Exception as e:
+            print(f"MongoDB에 연결할 수 없습니다 ({os.environ['DBCLIENT']}): {str(e)}")
+            return 1
+        await main.client.drop_database(os.environ["DBNAME"])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.storage == 'mongo':
+            await main.ensure_indexes()
+        await main.guild_configs.load()
+        await main.log_writer.start()
+
+    guild, mods, members = build_guild(args.moderators, args.targets)
+
+    scenarios = ['warn', 'mute', 'log', 'escalation'] if args.scenario == 'all' else [args.scenario]
+    print(f"모더레이터 {args.moderators}명 x 명령 {args.commands}개, 대상 {args.targets}명, "
+          f"REST 지연 {args.rest_latency}ms, 저장소 {args.storage}")
+    results = []
+    try:
+        for scenario in scenarios:
+            results.append(await run_scenario(scenario, guild, mods, members, args.commands))
+    finally:
+        main.mute_manager.scheduler.stop()
+        if args.storage == 'mongo' and not args.keep:
+            await main.client.drop_database(os.environ["DBNAME"])
+        if args.storage == 'sqlite' and not args.keep:
+            remove_sqlite_files()
+        with contextlib.suppress(OSError):
+            os.remove(os.environ["LOG_JOURNAL_PATH"])
+    print_results(results, args.verbose)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="복순이 명령어 부하 테스트")
+    parser.add_argument("--moderators", type=int, default=20, help="동시에 명령어를 쓰는 모더레이터 수")
+    parser.add_argument("--commands", type=int, default=25, help="모더레이터 한 명이 시나리오마다 보내는 명령 수")
+    parser.add_argument("--targets", type=int, default=200, help="처벌 대상 멤버 수")
+    parser.add_argument("--scenario", choices=['all', 'warn', 'mute', 'log', 'escalation'], default='all')
+    parser.add_argument("--rest-latency", type=float, default=0.0, help="가짜 REST 호출 하나의 지연(ms)")
+    parser.add_argument("--storage", choices=['memory', 'sqlite', 'mongo'], default='memory')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="끝난 뒤 벤치용 DB/파일을 지우지 않는다")
+    parser.add_argument("--verbose", action="store_true", help="DB 요청/REST 호출을 종류별로 출력")
+    args = parser.parse_args()
+    load_main(args.storage)
+    if args.storage == 'sqlite' and not args.keep:
+        # 지난 실행이 남긴 파일에서 시작하지 않도록 비운다
+        remove_sqlite_files()
+    sys.exit(asyncio.run(run(args)))
@@ -5,30 +5,120 @@
 import disnake
 from disnake.ext import commands
 import asyncio
-from datetime import datetime, timedelta
+import contextlib
+import functools
+import time
+import heapq
+import itertools
+import struct
+from datetime import datetime, timedelta, timezone
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+from bson import Binary, ObjectId, json_util
 import os
+import socket
+import sys
 from dotenv import load_dotenv
 from enum import Enum
-from typing import Literal, List, Dict, Tuple
+from collections import OrderedDict, deque
+from typing import Literal, List, Dict, Tuple, Optional, NamedTuple
+from storage import MotorStorage, create_storage
 
 load_dotenv()
 
 client = AsyncIOMotorClient(os.getenv("DBCLIENT"))
 BOT_TOKEN = os.getenv("BOTTOKEN")
-db = client["Boksun_db"]
-mute_logs_collection = db['mute_logs']
-user_roles_collection = db['user_roles']
-warnings_collection = db['warnings']
-kick_logs_collection = db['kick_logs']
-ban_logs_collection = db['ban_logs']
-
-intents = disnake.Intents.all()
-bot = commands.InteractionBot(intents=intents)
-
+db = client[os.getenv("DBNAME", "Boksun_db")]
+# 저장소: mongo(기본), memory(테스트/벤치마크), sqlite(STORAGE_PATH 파일 하나로 돌리는 작은 서버)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+STORAGE_PATH = os.getenv("STORAGE_PATH", "boksun.sqlite3")
+store = create_storage(STORAGE_BACKEND, db, STORAGE_PATH)
+leases_collection = db['leases']
+stream_tokens_collection = db['change_stream_tokens']
+
+# 게이트웨이 인텐트: minimal(길드/멤버 이벤트만) 또는 all
+INTENTS_PROFILE = os.getenv("INTENTS_PROFILE", "minimal")
+# 멤버 캐시: full(시작 시 전체 청크) 또는 lean(캐시 없이 필요할 때 조회)
+MEMBER_CACHE_POLICY = os.getenv("MEMBER_CACHE_POLICY", "full")
+RESOURCE_REPORT_INTERVAL = 600
+# 샤딩: AUTO_SHARD=1이면 자동 샤딩, 여러 프로세스로 나눌 때는 SHARD_COUNT와 SHARD_IDS(쉼표 구분)를 준다
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = [int(i) for i in os.getenv("SHARD_IDS").split(",")] if os.getenv("SHARD_IDS") else None
+SHARDED = os.getenv("AUTO_SHARD") == "1" or SHARD_COUNT is not None
+# 두 프로세스 이상 띄울 때 LEADER_LEASE=1이면 리스를 가진 프로세스만 재갈 만료를 처리한다
+LEADER_LEASE = os.getenv("LEADER_LEASE") == "1" and isinstance(store, MotorStorage)
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_TTL = 30
+LEASE_RENEW_INTERVAL = 10
+# CHANGE_STREAMS=1이면 다른 프로세스가 쓴 변경을 변경 스트림으로 받아 스케줄러와 캐시에 반영한다 (레플리카셋 필요)
+CHANGE_STREAMS = os.getenv("CHANGE_STREAMS") == "1" and isinstance(store, MotorStorage)
+STREAM_TOKEN_ID = "cache_sync:" + (os.getenv("INSTANCE_ID") or socket.gethostname())
+STREAM_TOKEN_SAVE_INTERVAL = 5
+# 타이머가 놓친 만료를 end_time 인덱스로 찾아 처리하는 주기 점검
+SWEEP_INTERVAL = 5
+SWEEP_BATCH_SIZE = 100
+SWEEP_GRACE = 2
+SWEEP_RETRY_INTERVAL = 300
+
+
+def build_intents(profile: str) -> disnake.Intents:
+    if profile == "all":
+        return disnake.Intents.all()
+    # 슬래시 명령어는 인텐트가 필요 없고, 재갈/권한 처리에 길드와 멤버 이벤트만 쓴다
+    intents = disnake.Intents.none()
+    intents.guilds = True
+    intents.members = True
+    return intents
+
+
+intents = build_intents(INTENTS_PROFILE)
+bot_options = {'intents': intents}
+if MEMBER_CACHE_POLICY == "lean":
+    bot_options.update(member_cache_flags=disnake.MemberCacheFlags.none(), chunk_guilds_at_startup=False)
+if SHARDED:
+    bot_options.update(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+    bot = commands.AutoShardedInteractionBot(**bot_options)
+else:
+    bot = commands.InteractionBot(**bot_options)
+
+# guild_config에 설정이 없는 길드가 쓰는 기본값
 MUTE_ROLE_ID = 795147706237714433
 # MUTE_ROLE_ID = 1272135394669891621  # 테스트
 ADMIN_ROLE_ID = [789359681776648202, 1185934968636067921, 1101725365342306415]
+GUILD_CONFIG_REFRESH_INTERVAL = 60
+
+# /로그 페이지당 항목 수, 전체 보기에서 종류별로 보여줄 개수
+LOG_PAGE_SIZE = 5
+RECENT_EVENTS_PER_TYPE = 3
+
+# 처벌 요약 캐시 설정
+SUMMARY_CACHE_SIZE = 1024
+SUMMARY_CACHE_TTL = 300
+
+# 처벌 기록 write-behind 설정
+# 같은 디렉터리에서 여러 프로세스(리더 리스 복제본, 샤드 프로세스)를 띄우면 서로의 저널을 덮어쓰지 않게 INSTANCE_ID를 붙인다
+# 재시작 후 저널을 다시 읽으려면 이름이 바뀌지 않도록 INSTANCE_ID를 고정해서 준다
+_MULTI_PROCESS = bool(os.getenv("INSTANCE_ID")) or LEADER_LEASE or SHARD_IDS is not None
+LOG_JOURNAL_PATH = os.getenv("LOG_JOURNAL_PATH") or (
+    "moderation_events.{}.journal".format("".join(c if c.isalnum() or c in "-_" else "_" for c in INSTANCE_ID))
+    if _MULTI_PROCESS else "moderation_events.journal"
+)
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 1.0
+JOURNAL_JSON_OPTIONS = json_util.CANONICAL_JSON_OPTIONS.with_options(tz_aware=False)
+
+# 재갈 방식: role(역할 교체) 또는 timeout(디스코드 타임아웃)
+MUTE_BACKEND = os.getenv("MUTE_BACKEND", "role")
+
+# 역할 수정 요청 재시도 횟수
+ROLE_EDIT_RETRIES = 4
+
+# 재갈 복구 설정
+RECOVERY_BATCH_SIZE = 200
+RECOVERY_CONCURRENCY = 5
+# 마감이 몰려도 해제 REST 호출은 동시에 이만큼만 보낸다
+UNMUTE_CONCURRENCY = 5
 
 
 class LogType(str, Enum):
@@ -39,89 +129,988 @@ class LogType(str, Enum):
     BAN = "사형"
 
 
-class MuteManager:
-    def __init__(self, db):
-        self.db = db
-        self.mute_collection = self.db['mute_tasks']
-        self.active_mutes = {}
+# moderation_events의 type 값
+EVENT_TYPES = {
+    LogType.WARNING: 'warning',
+    LogType.MUTE: 'mute',
+    LogType.KICK: 'kick',
+    LogType.BAN: 'ban',
+}
+
+EVENT_CATEGORIES = {event_type: log_type.value for log_type, event_type in EVENT_TYPES.items()}
+
+class EscalationRule(NamedTuple):
+    counter: str  # 검사할 user_stats 카운터
+    every: int  # 카운터가 이 배수가 될 때마다 발동
+    action: str  # mute / kick / ban
+    reason: str
+    message: str
+    duration: Optional[timedelta] = None
+
+
+# 누적 처벌을 카운터 -> 규칙 전이표로 만들어 한 번에 평가한다
+class EscalationPolicy:
+    # 후속 처벌이 올리는 카운터
+    ACTION_COUNTERS = {'mute': 'mutes', 'kick': 'kicks', 'ban': 'bans'}
+
+    def __init__(self, rules: List[EscalationRule]):
+        self.rules = list(rules)
+        self._transitions = {rule.counter: rule for rule in self.rules}
+
+    def evaluate(self, stats: Dict, counter: str) -> List[EscalationRule]:
+        counts = {}
+        actions = []
+        while counter in self._transitions and counter not in counts:
+            count = stats.get(counter, 0) + (1 if actions else 0)
+            counts[counter] = count
+            rule = self._transitions[counter]
+            if count == 0 or count % rule.every != 0:
+                break
+            actions.append(rule)
+            counter = self.ACTION_COUNTERS.get(rule.action)
+        return actions
+
+
+DEFAULT_ESCALATION_RULES = [
+    EscalationRule('warnings_added', 3, 'mute', "경고 3회 누적", "경고 3회 누적으로 1일 재갈 처리되었습니다.",
+                   timedelta(days=1)),
+    EscalationRule('mutes', 3, 'kick', "뮤트 3회 누적", "재갈 3회 누적으로 퇴출 처리되었습니다."),
+    EscalationRule('kicks', 2, 'ban', "추방 2회 누적", "추방 2회 누적으로 사형 처리되었습니다."),
+]
+
+# 길드별 설정 (guild_config 문서 하나를 메모리에 풀어둔 것)
+class GuildConfig:
+    def __init__(self, guild_id: Optional[int], mute_role_id: int, admin_role_ids: List[int],
+                 log_channel_id: Optional[int], escalation_rules: List[EscalationRule]):
+        self.guild_id = guild_id
+        self.mute_role_id = mute_role_id
+        self.admin_role_ids = frozenset(admin_role_ids)
+        self.log_channel_id = log_channel_id
+        self.escalation = EscalationPolicy(escalation_rules)
+
+    @classmethod
+    def from_doc(cls, doc: Dict) -> "GuildConfig":
+        rules = DEFAULT_ESCALATION_RULES
+        if doc.get('escalation'):
+            rules = [
+                EscalationRule(rule['counter'], rule['every'], rule['action'], rule['reason'], rule['message'],
+                               timedelta(seconds=rule['duration']) if rule.get('duration') else None)
+                for rule in doc['escalation']
+            ]
+            for rule in rules:
+                if rule.action not in EscalationPolicy.ACTION_COUNTERS:
+                    raise ValueError(f"알 수 없는 처벌입니다: {rule.counter} {rule.action}")
+                if not isinstance(rule.every, int) or rule.every < 1:
+                    raise ValueError(f"every는 1 이상이어야 합니다: {rule.counter} {rule.every}")
+                # 재갈 규칙은 기간이 있어야 발동할 때 종료 시각을 계산할 수 있다
+                if rule.action == 'mute' and rule.duration is None:
+                    raise ValueError(f"재갈 규칙에 duration이 없습니다: {rule.counter} {rule.every}회")
+        # 기본값은 키가 없을 때만 쓴다 (빈 목록/None은 서버가 일부러 비워둔 것)
+        return cls(
+            doc.get('guild_id'),
+            doc['mute_role_id'] if 'mute_role_id' in doc else MUTE_ROLE_ID,
+            doc['admin_role_ids'] if 'admin_role_ids' in doc else ADMIN_ROLE_ID,
+            doc.get('log_channel_id'),
+            rules,
+        )
+
+
+class GuildConfigCache:
+    def __init__(self, store, refresh_interval: float):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self._configs: Dict[int, GuildConfig] = {}
+        self._default = GuildConfig.from_doc({})
+        self._last_updated = None
+        self._task = None
+
+    def get(self, guild_id: int) -> GuildConfig:
+        return self._configs.get(guild_id, self._default)
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._configs
+
+    async def load(self):
+        self._configs.clear()
+        self._last_updated = None
+        authorizer.invalidate()
+        await self.refresh()
+        print(f"길드 설정 {len(self._configs)}개를 불러왔습니다.")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def refresh(self) -> int:
+        # 마지막으로 읽은 뒤 바뀐 설정만 다시 읽는다
+        changed = 0
+        async for doc in self.store.iter_guild_configs(self._last_updated):
+            self._apply(doc)
+            changed += 1
+        return changed
+
+    async def update(self, guild_id: int, changes: Dict) -> GuildConfig:
+        return self._apply(await self.store.update_guild_config(guild_id, changes))
+
+    def _apply(self, doc: Dict) -> GuildConfig:
+        try:
+            config = GuildConfig.from_doc(doc)
+        except ValueError as e:
+            # 잘못된 설정은 건너뛰고 이전 설정을 유지한다 (다음 갱신에서 다시 읽지 않도록 시각은 넘긴다)
+            print(f"{doc['guild_id']} 길드 설정 오류: {str(e)}")
+            config = self.get(doc['guild_id'])
+        else:
+            self._configs[doc['guild_id']] = config
+            authorizer.invalidate(doc['guild_id'])
+        updated_at = doc.get('updated_at')
+        if updated_at and (self._last_updated is None or updated_at > self._last_updated):
+            self._last_updated = updated_at
+        return config
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"길드 설정 갱신 중 오류 발생: {str(e)}")
+
+
+# 멤버별 관리자 여부를 기억해두고 역할이나 설정이 바뀔 때만 다시 계산한다
+class AdminAuthorizer:
+    def __init__(self):
+        self._memo: Dict[Tuple[int, int], bool] = {}
+
+    def is_admin(self, member: disnake.Member, guild_id: int) -> bool:
+        key = (guild_id, member.id)
+        allowed = self._memo.get(key)
+        if allowed is None:
+            admin_role_ids = guild_configs.get(guild_id).admin_role_ids
+            allowed = not admin_role_ids.isdisjoint(role.id for role in member.roles)
+            self._memo[key] = allowed
+        return allowed
+
+    def can_configure(self, member: disnake.Member, guild_id: int) -> bool:
+        # 설정이 없거나 관리자 역할을 비운 서버는 아무도 관리자가 아니므로 /설정만 서버 관리자 권한으로 허용한다
+        if self.is_admin(member, guild_id):
+            return True
+        unconfigured = guild_id not in guild_configs or not guild_configs.get(guild_id).admin_role_ids
+        return unconfigured and member.guild_permissions.administrator
+
+    def invalidate(self, guild_id: int = None, member_id: int = None):
+        if guild_id is None:
+            self._memo.clear()
+        elif member_id is not None:
+            self._memo.pop((guild_id, member_id), None)
+        else:
+            for key in [key for key in self._memo if key[0] == guild_id]:
+                del self._memo[key]
+
+
+async def require_admin(inter: disnake.Interaction, bootstrap: bool = False) -> bool:
+    # 권한이 없으면 defer 없이 바로 거절한다 (명령어와 버튼 모두)
+    check = authorizer.can_configure if bootstrap else authorizer.is_admin
+    if inter.guild is not None and check(inter.author, inter.guild.id):
+        return True
+    await inter.response.send_message("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
+    return False
+
+
+def get_escalation_policy(guild_id: int) -> EscalationPolicy:
+    return guild_configs.get(guild_id).escalation
+
+
+# 기존 컬렉션 -> (이벤트 type, 시간 필드, 처리자 필드, 기본 action)
+LEGACY_EVENT_SOURCES = {
+    'warnings': ('warning', 'warned_at', 'warned_by', 'add'),
+    'mute_logs': ('mute', 'muted_at', 'muted_by', 'mute'),
+    'kick_logs': ('kick', 'kicked_at', 'kicked_by', 'kick'),
+    'ban_logs': ('ban', 'banned_at', 'banned_by', 'ban'),
+}
+
+
+# end_time 기준 최소 힙 하나로 모든 재갈 해제를 처리하는 스케줄러
+class UnmuteScheduler:
+    def __init__(self, callback, concurrency: int):
+        self._callback = callback
+        self._heap = []  # [end_time, seq, guild_id, user_id, alive]
+        self._entries = {}  # (guild_id, user_id) -> 힙 항목
+        self._seq = itertools.count()
+        self._removed = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._slots = asyncio.Semaphore(concurrency)
+        self._running = set()  # 실행 중인 콜백 태스크 (GC 방지)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._entries)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    @property
+    def next_deadline(self) -> Optional[datetime]:
+        self._drop_dead_head()
+        return self._heap[0][0] if self._heap else None
+
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        return key in self._entries
+
+    def keys(self) -> List[Tuple[int, int]]:
+        return list(self._entries)
+
+    def get(self, guild_id: int, user_id: int) -> Optional[datetime]:
+        entry = self._entries.get((guild_id, user_id))
+        return entry[0] if entry else None
+
+    def schedule(self, guild_id: int, user_id: int, end_time: datetime):
+        self.cancel(guild_id, user_id)
+        entry = [end_time, next(self._seq), guild_id, user_id, True]
+        self._entries[(guild_id, user_id)] = entry
+        heapq.heappush(self._heap, entry)
+        # 가장 가까운 마감이 바뀐 경우에만 깨운다
+        if self._heap[0] is entry:
+            self._wakeup.set()
+        self._ensure_running()
+
+    def cancel(self, guild_id: int, user_id: int) -> bool:
+        entry = self._entries.pop((guild_id, user_id), None)
+        if entry is None:
+            return False
+        entry[4] = False
+        self._removed += 1
+        # 취소된 항목이 절반을 넘으면 힙을 다시 만든다
+        if self._removed > len(self._heap) // 2:
+            self._heap = [e for e in self._heap if e[4]]
+            heapq.heapify(self._heap)
+            self._removed = 0
+        return True
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running:
+            task.cancel()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _drop_dead_head(self):
+        while self._heap and not self._heap[0][4]:
+            heapq.heappop(self._heap)
+            self._removed -= 1
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            self._drop_dead_head()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            end_time, _, guild_id, user_id, _ = self._heap[0]
+            delay = (end_time - datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # 콜백이 모두 돌고 있으면 자리가 날 때까지 기다린 뒤 머리를 다시 본다
+            await self._slots.acquire()
+            self._drop_dead_head()
+            if not self._heap or self._heap[0][0] > datetime.now():
+                self._slots.release()
+                continue
+            end_time, _, guild_id, user_id, _ = heapq.heappop(self._heap)
+            del self._entries[(guild_id, user_id)]
+            task = asyncio.create_task(self._fire(guild_id, user_id))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _fire(self, guild_id: int, user_id: int):
+        try:
+            await self._callback(guild_id, user_id)
+        except Exception as e:
+            print(f"{user_id} 재갈 해제 스케줄 처리 중 오류 발생: {str(e)}")
+        finally:
+            self._slots.release()
+
+
+# 처벌 기록을 로컬 저널에 먼저 남기고 저장소에는 모아서 쓰는 write-behind 기록기
+class LogWriter:
+    def __init__(self, store, journal_path: str, batch_size: int, flush_interval: float):
+        self.store = store
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._file_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._replayed = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        if await self._replay():
+            await self.flush()
+        self._ensure_running()
+
+    async def _replay(self) -> int:
+        # 지난 실행에서 Mongo에 못 쓴 기록을 저널에서 다시 읽는다
+        # 첫 쓰기/flush 전에 한 번 해야 저널을 다시 쓸 때 남은 기록을 덮어쓰지 않는다
+        if self._replayed:
+            return 0
+        async with self._file_lock:
+            if self._replayed:
+                return 0
+            leftover = await asyncio.to_thread(self._read_journal)
+            known = {doc['_id'] for doc in self._pending}
+            self._pending[:0] = [doc for doc in leftover if doc['_id'] not in known]
+            self._replayed = True
+        if leftover:
+            print(f"저널에서 처벌 기록 {len(leftover)}건을 복구합니다.")
+        return len(leftover)
+
+    async def write(self, doc: Dict):
+        # _id를 미리 정해두면 저널 재실행 시 중복 삽입을 막을 수 있다
+        doc.setdefault('_id', ObjectId())
+        await self._replay()
+        async with self._file_lock:
+            await asyncio.to_thread(self._append, doc)
+            self._pending.append(doc)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        self._ensure_running()
+
+    async def flush(self) -> int:
+        await self._replay()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch = self._pending[:]
+            # 이미 들어간 문서(같은 _id)는 저장소가 건너뛴다
+            await self.store.insert_events(batch)
+            async with self._file_lock:
+                del self._pending[:len(batch)]
+                await asyncio.to_thread(self._rewrite_journal, list(self._pending))
+            return len(batch)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"처벌 기록 저장 중 오류 발생 (대기 {len(self._pending)}건): {str(e)}")
+
+    def _append(self, doc: Dict):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json_util.dumps(doc, json_options=JOURNAL_JSON_OPTIONS) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_journal(self, docs: List[Dict]):
+        temp_path = f"{self.journal_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for doc in docs:
+                f.write(json_util.dumps(doc, json_options=JOURNAL_JSON_OPTIONS) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+
+    def _read_journal(self) -> List[Dict]:
+        if not os.path.exists(self.journal_path):
+            return []
+        docs = []
+        with open(self.journal_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    docs.append(json_util.loads(line, json_options=JOURNAL_JSON_OPTIONS))
+                except ValueError:
+                    # 쓰다가 꺼져서 잘린 마지막 줄
+                    print("저널의 손상된 줄을 건너뜁니다.")
+        return docs
+
+
+# 여러 프로세스 중 리스를 가진 하나만 재갈 만료를 처리하도록 하는 리더 선출
+class LeaderLease:
+    def __init__(self, collection, name: str, holder: str, ttl: float, renew_interval: float,
+                 enabled: bool = True, on_acquire=None):
+        self.collection = collection
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.enabled = enabled
+        self.on_acquire = on_acquire
+        self._leader = False
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._acquire_task: Optional[asyncio.Task] = None
+        self.stats = {'acquisitions': 0, 'losses': 0, 'renew_errors': 0, 'last_failover_seconds': None}
+
+    @property
+    def is_leader(self) -> bool:
+        # 갱신이 실패하면 DB의 리스가 끝나기 전에 스스로 리더 역할을 멈춘다
+        if not self.enabled:
+            return True
+        return self._leader and time.monotonic() < self._valid_until
 
-    async def mute_user(self, member: disnake.Member, guild: disnake.Guild, reason: str, end_time: datetime, muted_by: disnake.Member):
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        # 처음 획득은 on_ready 복구가 처리하므로 콜백을 부르지 않는다
+        await self._step()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            was_leader = self.is_leader
+            await self._step()
+            if self.is_leader and not was_leader and self.on_acquire:
+                # 태스크 참조를 들고 있어야 복구 도중 GC되지 않는다
+                if self._acquire_task is None or self._acquire_task.done():
+                    self._acquire_task = asyncio.create_task(self.on_acquire())
+
+    async def _step(self):
+        started = time.monotonic()
+        # 프로세스마다 시계(시간대)가 다를 수 있어 시각은 모두 DB 서버의 $$NOW로 쓰고 비교한다
+        expires_at = {'$add': ['$$NOW', int(self.ttl * 1000)]}
         try:
-            mute_role = guild.get_role(MUTE_ROLE_ID)
-            if not mute_role:
-                print("재갈 역할을 찾을 수 없습니다.")
+            renewed = await self.collection.update_one(
+                {'_id': self.name, 'holder': self.holder},
+                [{'$set': {'expires_at': expires_at, 'renewed_at': '$$NOW', 'clock': 'server'}}]
+            )
+            if renewed.matched_count:
+                self._valid_until = started + self.ttl
+                self._leader = True
                 return
+            if self._leader:
+                self._lose("다른 프로세스가 리스를 가져갔습니다")
+            # 리스가 끝났을 때만 가져온다 (문서가 없으면 새로 만들고, 끝나지 않았으면 중복 키로 실패한다)
+            # clock이 없는 문서는 예전 버전이 로컬 시각으로 쓴 것이라 끝난 것으로 본다
+            lease = await self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'$expr': {'$lt': ['$expires_at', '$$NOW']}},
+                                           {'clock': {'$ne': 'server'}}]},
+                [{'$set': {'previous_holder': '$holder', 'previous_renewed_at': '$renewed_at',
+                           'holder': self.holder, 'expires_at': expires_at, 'renewed_at': '$$NOW',
+                           'acquired_at': '$$NOW', 'clock': 'server',
+                           'epoch': {'$add': [{'$ifNull': ['$epoch', 0]}, 1]}}}],
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return
+        except PyMongoError as e:
+            self.stats['renew_errors'] += 1
+            print(f"리더 리스 갱신 중 오류 발생: {str(e)}")
+            if self._leader and not self.is_leader:
+                self._lose("리스 갱신 실패")
+            return
+        self._valid_until = started + self.ttl
+        self._leader = True
+        self.stats['acquisitions'] += 1
+        previous = lease.get('previous_holder')
+        if previous is not None and lease.get('previous_renewed_at') is not None:
+            # 이전 리더가 마지막으로 갱신한 뒤 넘겨받기까지 걸린 시간
+            failover = lease['acquired_at'] - lease['previous_renewed_at']
+            self.stats['last_failover_seconds'] = round(failover.total_seconds(), 1)
+        print(f"리더 리스를 획득했습니다: {self.name} ({self.holder}, 이전 {previous or '없음'})")
+
+    def _lose(self, reason: str):
+        self._leader = False
+        self.stats['losses'] += 1
+        print(f"리더 리스를 잃었습니다: {self.name} ({reason})")
+
+    async def info(self) -> Dict:
+        doc = await self.collection.find_one({'_id': self.name}) if self.enabled else None
+        return {'leader': self.is_leader, 'holder': doc['holder'] if doc else None,
+                'epoch': doc.get('epoch') if doc else None, **self.stats}
+
+
+# 다른 프로세스나 관리 도구가 쓴 변경을 받아 스케줄러와 캐시를 맞춘다
+class ChangeStreamSync:
+    # user_roles는 메모리에 두는 상태가 없어서 보지 않는다
+    WATCHED = ('mute_tasks', 'user_stats', 'moderation_events', 'guild_config')
+    NOT_REPLICA_SET = 40573
+    RESUME_FAILED = (280, 286)
+
+    def __init__(self, db, token_collection, token_id: str, save_interval: float):
+        self.db = db
+        self.token_collection = token_collection
+        self.token_id = token_id
+        self.save_interval = save_interval
+        # 삭제 이벤트에는 _id만 오므로 재갈 예약 키를 따로 기억한다
+        self._mute_keys: Dict[ObjectId, Tuple[int, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {name: 0 for name in self.WATCHED}
+        self.stats.update(errors=0, resyncs=0)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        doc = await self.token_collection.find_one({'_id': self.token_id})
+        token = doc['token'] if doc else None
+        pipeline = [{'$match': {'ns.coll': {'$in': list(self.WATCHED)},
+                                'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        while True:
+            try:
+                async with self.db.watch(pipeline, full_document='updateLookup', resume_after=token) as stream:
+                    await self._seed()
+                    if token is None:
+                        print("변경 스트림 동기화를 시작합니다.")
+                    saved_at = time.monotonic()
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            try:
+                                self._apply(change)
+                            except Exception as e:
+                                # 변경 하나를 못 맞춰도 스트림은 계속 읽는다
+                                self.stats['errors'] += 1
+                                print(f"변경 스트림 적용 중 오류 발생 ({change['ns']['coll']}): {str(e)}")
+                        token = stream.resume_token
+                        if token is not None and time.monotonic() - saved_at >= self.save_interval:
+                            await self._save(token)
+                            saved_at = time.monotonic()
+            except OperationFailure as e:
+                if e.code == self.NOT_REPLICA_SET:
+                    print("레플리카셋이 아니라서 변경 스트림을 쓸 수 없습니다.")
+                    return
+                if e.code in self.RESUME_FAILED:
+                    # 재개 지점이 oplog에서 사라졌으면 처음부터 다시 맞춘다
+                    print("변경 스트림을 이어받을 수 없어 전체를 다시 읽습니다.")
+                    token = None
+                    await self._resync()
+                    continue
+                self.stats['errors'] += 1
+                print(f"변경 스트림 오류 발생: {str(e)}")
+            except PyMongoError as e:
+                self.stats['errors'] += 1
+                print(f"변경 스트림 오류 발생: {str(e)}")
+            await asyncio.sleep(5)
+
+    async def _seed(self):
+        self._mute_keys.clear()
+        async for mute in self.db['mute_tasks'].find({}, {'guild_id': 1, 'user_id': 1}):
+            self._mute_keys[mute['_id']] = (mute['guild_id'], mute['user_id'])
+
+    async def _save(self, token):
+        await self.token_collection.update_one(
+            {'_id': self.token_id}, {'$set': {'token': token, 'updated_at': datetime.now()}}, upsert=True
+        )
+
+    async def _resync(self):
+        self.stats['resyncs'] += 1
+        await self.token_collection.delete_one({'_id': self.token_id})
+        summary_cache.invalidate()
+        await guild_configs.refresh()
+        # 재갈 복구는 리더만 한다
+        if leader_lease.is_leader:
+            await recover_mutes()
+
+    def _apply(self, change: Dict):
+        collection = change['ns']['coll']
+        doc = change.get('fullDocument')
+        self.stats[collection] += 1
+        if collection == 'mute_tasks':
+            self._apply_mute(change['operationType'], change['documentKey']['_id'], doc)
+        elif collection == 'user_stats':
+            if doc is None:
+                summary_cache.invalidate()
+            else:
+                summary_cache.write((doc['guild_id'], doc['user_id']), doc)
+        elif collection == 'moderation_events':
+            # 카운터는 user_stats 변경으로 맞추므로 최근 기록만 버린다
+            key = (doc.get('guild_id'), doc['user_id']) if doc else None
+            summary_cache.discard('recent', key)
+        elif collection == 'guild_config' and doc is not None:
+            guild_configs._apply(doc)
+
+    def _apply_mute(self, operation: str, doc_id: ObjectId, doc: Optional[Dict]):
+        scheduler = mute_manager.scheduler
+        if operation == 'delete' or doc is None:
+            key = self._mute_keys.pop(doc_id, None)
+            if key is not None:
+                scheduler.cancel(*key)
+            return
+        key = (doc['guild_id'], doc['user_id'])
+        self._mute_keys[doc_id] = key
+        # 이 프로세스(샤드)에 없는 길드는 예약하지 않는다
+        if bot.get_guild(key[0]) is None:
+            return
+        backend = mute_manager.backend
+        end_time = doc['end_time']
+        scheduled = scheduler.get(*key)
+        check_at = backend.next_check(end_time)
+        if scheduled is not None and (scheduled == check_at or (backend.platform_expiry and scheduled < end_time)):
+            return
+        scheduler.schedule(*key, check_at)
+
+
+# 같은 대상에 대한 처벌은 순서대로, 다른 대상은 병렬로 처리하기 위한 키별 락
+class KeyedLock:
+    def __init__(self):
+        self._locks = {}  # key -> [asyncio.Lock, 사용 중인 수]
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        started = time.monotonic()
+        try:
+            if entry[0].locked():
+                self.contended += 1
+            async with entry[0]:
+                waited = time.monotonic() - started
+                self.acquisitions += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def info(self) -> Dict:
+        return {
+            'active_keys': len(self._locks),
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'avg_wait': self.total_wait / self.acquisitions if self.acquisitions else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+
+# (guild_id, user_id)별 처벌 요약(카운터, 최근 기록)을 담는 TTL + LRU 캐시
+class SummaryCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (만료 시각, {필드: 값})
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[int, int], field: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None or field not in entry[1]:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1][field]
+
+    def put(self, key: Tuple[int, int], field: str, value):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= now:
+            entry = (now + self.ttl, {})
+            self._entries[key] = entry
+        entry[1][field] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def write(self, key: Tuple[int, int], stats: Dict):
+        # 기록이 추가되면 카운터는 새 값으로 바꾸고 최근 기록은 버린다
+        self._entries.pop(key, None)
+        self.put(key, 'stats', stats)
+
+    def discard(self, field: str, key: Tuple[int, int] = None):
+        entries = self._entries.values() if key is None else [self._entries[key]] if key in self._entries else []
+        for _, fields in entries:
+            fields.pop(field, None)
+
+    def invalidate(self, key: Tuple[int, int] = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def info(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+async def call_with_retry(factory, attempts: int = None):
+    # 레이트 리밋(429)이나 서버 오류(5xx)는 점점 길게 기다렸다가 다시 시도한다
+    attempts = attempts or ROLE_EDIT_RETRIES
+    delay = 1.0
+    for attempt in range(attempts):
+        try:
+            return await factory()
+        except disnake.HTTPException as e:
+            if (e.status != 429 and e.status < 500) or attempt == attempts - 1:
+                raise
+            await asyncio.sleep(retry_after_seconds(e) or delay)
+            delay *= 2
+
+
+def retry_after_seconds(error: disnake.HTTPException) -> Optional[float]:
+    # disnake는 429를 스스로 몇 번 재시도한 뒤에 올리므로, 남은 대기 시간은 응답 헤더에서 읽는다
+    headers = getattr(error.response, 'headers', None) or {}
+    value = headers.get('Retry-After') or headers.get('X-RateLimit-Reset-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# 역할 스냅샷은 (guild_id, user_id)별로 역할 ID를 int64 배열로 묶어서 저장한다
+ROLE_SNAPSHOT_VERSION = 2
+
+
+def pack_role_ids(role_ids: List[int]) -> Binary:
+    return Binary(struct.pack(f"<{len(role_ids)}q", *role_ids))
+
+
+def unpack_role_ids(snapshot: Dict) -> List[int]:
+    if snapshot.get('v', 1) < ROLE_SNAPSHOT_VERSION:
+        return list(snapshot.get('roles', []))  # 예전 형식 (int 리스트)
+    packed = bytes(snapshot['roles'])
+    return list(struct.unpack(f"<{len(packed) // 8}q", packed))
+
+
+# 역할을 통째로 바꿔서 재갈을 거는 방식 (해제는 봇의 스케줄러가 담당)
+# user_roles 문서가 작업 기록을 겸한다: pending(재갈 적용 중) -> applied, restoring(해제 중) -> 삭제
+class RoleMuteBackend:
+    platform_expiry = False
+
+    def is_muted(self, member: disnake.Member, guild: disnake.Guild) -> bool:
+        mute_role_id = guild_configs.get(guild.id).mute_role_id
+        return any(role.id == mute_role_id for role in member.roles)
+
+    def next_check(self, end_time: datetime) -> datetime:
+        return end_time
+
+    async def mute(self, member: disnake.Member, guild: disnake.Guild, end_time: datetime) -> bool:
+        mute_role = guild.get_role(guild_configs.get(guild.id).mute_role_id)
+        if not mute_role:
+            print("재갈 역할을 찾을 수 없습니다.")
+            return False
+
+        current_roles = [role.id for role in member.roles if role.id != guild.id and role.id != mute_role.id
+                         and not role.managed]
+        await store.save_snapshot(guild.id, member.id, {
+            'v': ROLE_SNAPSHOT_VERSION, 'roles': pack_role_ids(current_roles), 'state': 'pending'
+        })
+        try:
+            await self._apply_mute(member, mute_role)
+        except Exception:
+            # 역할을 못 바꿨으면 나중에 재개할 작업도 남기지 않는다
+            snapshot = await store.claim_snapshot(guild.id, member.id)
+            if snapshot:
+                await store.delete_snapshot(snapshot)
+            raise
+        await store.save_snapshot(guild.id, member.id, {'state': 'applied'})
+        return True
+
+    async def unmute(self, member: disnake.Member, guild: disnake.Guild) -> bool:
+        user_roles = await store.claim_snapshot(guild.id, member.id)
+        await self._apply_restore(member, guild, unpack_role_ids(user_roles) if user_roles else [])
+        if user_roles:
+            await store.delete_snapshot(user_roles)
+        return True
+
+    async def _apply_mute(self, member: disnake.Member, mute_role: disnake.Role):
+        # 관리형 역할(부스터, 봇 연동)은 뺄 수 없으므로 그대로 두고 한 번의 요청으로 교체한다
+        roles = [role for role in member.roles if role.managed] + [mute_role]
+        await call_with_retry(lambda: member.edit(roles=roles, reason="Mute"))
+
+    async def _apply_restore(self, member: disnake.Member, guild: disnake.Guild, role_ids: List[int]):
+        # 재갈 중에 따로 받은 역할은 유지하고 저장해둔 역할을 되돌린다
+        mute_role_id = guild_configs.get(guild.id).mute_role_id
+        roles = {role.id: role for role in member.roles if role.id != guild.id and role.id != mute_role_id}
+        for role in map(guild.get_role, role_ids):
+            if role is not None and not role.managed:
+                roles.setdefault(role.id, role)
+        await call_with_retry(lambda: member.edit(roles=list(roles.values()), reason="Unmute"))
+
+    async def resume_pending(self, bot, guild_ids: Optional[List[int]] = None) -> int:
+        # 봇이 역할 교체 도중 꺼졌던 작업을 이어서 끝낸다
+        resumed = 0
+        async for intent in store.iter_unfinished_snapshots(guild_ids):
+            guild = bot.get_guild(intent.get('guild_id'))
+            member = await resolve_member(guild, intent['user_id']) if guild else None
+            if member is None:
+                continue
+            try:
+                if intent['state'] == 'pending':
+                    # 재갈 예약이 없으면 명령이 끝나지 못한 것이므로 재갈을 걸지 않고 버린다
+                    if await store.get_mute_task(guild.id, member.id) is None:
+                        await store.delete_snapshot(intent)
+                        continue
+                    mute_role = guild.get_role(guild_configs.get(guild.id).mute_role_id)
+                    if mute_role and not self.is_muted(member, guild):
+                        await self._apply_mute(member, mute_role)
+                    await store.set_snapshot_state(intent, 'applied')
+                else:
+                    await self._apply_restore(member, guild, unpack_role_ids(intent))
+                    await store.delete_snapshot(intent)
+                resumed += 1
+            except disnake.HTTPException as e:
+                print(f"{member} 역할 작업 재개 중 오류 발생: {str(e)}")
+        if resumed:
+            print(f"중단된 역할 작업 {resumed}건을 마쳤습니다.")
+        return resumed
+
+
+# 디스코드 타임아웃(communication_disabled_until)으로 재갈을 거는 방식 (해제는 디스코드가 처리)
+class TimeoutMuteBackend:
+    platform_expiry = True
+    MAX_TIMEOUT = timedelta(days=28)
+
+    def is_muted(self, member: disnake.Member, guild: disnake.Guild) -> bool:
+        return member.current_timeout is not None
+
+    def next_check(self, end_time: datetime) -> datetime:
+        # 디스코드 타임아웃은 최대 28일이라 그보다 긴 재갈은 중간에 다시 걸어준다
+        return min(end_time, datetime.now() + self.MAX_TIMEOUT)
+
+    async def mute(self, member: disnake.Member, guild: disnake.Guild, end_time: datetime) -> bool:
+        until = self.next_check(end_time)
+        await member.timeout(until=until.astimezone(timezone.utc), reason="Mute")
+        return True
+
+    async def unmute(self, member: disnake.Member, guild: disnake.Guild) -> bool:
+        await member.timeout(duration=None, reason="Unmute")
+        return True
+
+
+MUTE_BACKENDS = {
+    'role': RoleMuteBackend,
+    'timeout': TimeoutMuteBackend,
+}
+
+
+class MuteManager:
+    def __init__(self, store, bot, backend=None):
+        self.store = store
+        self.bot = bot
+        self.backend = backend or RoleMuteBackend()
+        self.scheduler = UnmuteScheduler(self.expire_mute, UNMUTE_CONCURRENCY)
+        self._load_locks: Dict[Optional[int], asyncio.Lock] = {}
 
-            if mute_role in member.roles:
+    async def mute_user(self, member: disnake.Member, guild: disnake.Guild, reason: str, end_time: datetime, muted_by: disnake.Member):
+        try:
+            if self.backend.is_muted(member, guild):
                 print(f"{member}는 이미 재갈 상태입니다.")
                 return
 
-            current_roles = [role.id for role in member.roles if role.id != guild.id and role.id != MUTE_ROLE_ID]
-            await user_roles_collection.update_one(
-                {'user_id': member.id},
-                {'$set': {'roles': current_roles}},
-                upsert=True
-            )
-
-            roles_to_remove = [role for role in member.roles if role.id != guild.id and role.id != MUTE_ROLE_ID]
-            await member.remove_roles(*roles_to_remove, reason="Mute")
-            await member.add_roles(mute_role)
+            # 디스코드가 해제까지 맡는 경우에는 기록도 예약도 필요 없다
+            check_at = self.backend.next_check(end_time)
+            needs_task = not (self.backend.platform_expiry and check_at >= end_time)
 
-            # MongoDB에 뮤트 정보 저장
-            await self.mute_collection.update_one(
-                {'user_id': member.id},
-                {'$set': {
-                    'user_id': member.id,
-                    'guild_id': guild.id,
+            # 재갈을 걸다가 봇이 꺼져도 복구 때 만료를 예약할 수 있게 먼저 저장한다
+            if needs_task:
+                await self.store.save_mute_task(guild.id, member.id, {
                     'end_time': end_time,
                     'reason': reason,
                     'muted_by': muted_by.id
-                }},
-                upsert=True
-            )
+                })
+            muted = False
+            try:
+                muted = await self.backend.mute(member, guild, end_time)
+            finally:
+                if needs_task and not muted:
+                    await self.store.delete_mute_task(guild.id, member.id)
+            if not muted or not needs_task:
+                return
 
-            # 비동기적으로 unmute 스케줄링
-            self.active_mutes[member.id] = asyncio.create_task(self.schedule_unmute(member, guild, end_time))
+            # 스케줄러 힙에 해제(또는 연장) 시간 등록
+            self.scheduler.schedule(guild.id, member.id, check_at)
 
         except disnake.Forbidden:
             print(f"봇에게 {member}를 뮤트할 권한이 없습니다.")
         except Exception as e:
             print(f"{member} 뮤트 중 오류 발생: {str(e)}")
 
-    async def schedule_unmute(self, member: disnake.Member, guild: disnake.Guild, end_time: datetime):
-        try:
-            await asyncio.sleep((end_time - datetime.now()).total_seconds())
+    async def expire_mute(self, guild_id: int, user_id: int):
+        # 대기 프로세스는 해제하지 않는다 (리더가 되면 DB에서 다시 복구한다)
+        if not leader_lease.is_leader:
+            return
+        # 만료 시점에 길드와 멤버를 새로 조회한다
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+        member = await resolve_member(guild, user_id)
+        if member is None:
+            # 서버를 나간 멤버는 풀 수 없으니 예약만 지운다 (남겨두면 만료 점검이 계속 다시 읽는다)
+            await self.store.delete_mute_task(guild_id, user_id)
+            self.scheduler.cancel(guild_id, user_id)
+            print(f"{user_id}는 서버에 없어 재갈 예약을 정리했습니다.")
+            return
+        async with target_locks.hold((guild_id, user_id)):
+            if self.backend.platform_expiry:
+                # 28일보다 긴 타임아웃은 끝나지 않았으면 다시 연장한다
+                mute = await self.store.get_mute_task(guild_id, user_id)
+                if mute and mute['end_time'] > datetime.now():
+                    await self.backend.mute(member, guild, mute['end_time'])
+                    self.scheduler.schedule(guild_id, user_id, self.backend.next_check(mute['end_time']))
+                    return
             await self.unmute_user(member, guild)
-        except asyncio.CancelledError:
-            pass
 
     async def unmute_user(self, member: disnake.Member, guild: disnake.Guild) -> bool:
         try:
-            mute_role = guild.get_role(MUTE_ROLE_ID)
-            if not mute_role:
-                print("뮤트 역할을 찾을 수 없습니다.")
-                return False
-
-            if mute_role not in member.roles:
+            if not self.backend.is_muted(member, guild):
                 print(f"{member}는 뮤트 상태가 아닙니다.")
+                # 이미 풀려 있으면(디스코드 만료, 관리자가 역할을 직접 뺌) 남은 예약만 정리한다
+                await self.store.delete_mute_task(guild.id, member.id)
+                self.scheduler.cancel(guild.id, member.id)
                 return False
 
-            await member.remove_roles(mute_role)
-
-            user_roles = await user_roles_collection.find_one({'user_id': member.id})
-            if user_roles:
-                roles_to_add = [guild.get_role(role_id) for role_id in user_roles['roles'] if
-                                guild.get_role(role_id) is not None]
-                await member.add_roles(*roles_to_add)
-                await user_roles_collection.delete_one({'user_id': member.id})
+            if not await self.backend.unmute(member, guild):
+                return False
 
-            # MongoDB에서 뮤트 정보 제거
-            await self.mute_collection.delete_one({'user_id': member.id})
+            # 저장소에서 뮤트 정보 제거
+            await self.store.delete_mute_task(guild.id, member.id)
 
-            # 활성 뮤트에서 제거
-            if member.id in self.active_mutes:
-                self.active_mutes[member.id].cancel()
-                del self.active_mutes[member.id]
+            # 스케줄러에서 제거
+            self.scheduler.cancel(guild.id, member.id)
 
             print(f"{member}의 뮤트가 해제되었습니다.")
             return True
@@ -131,71 +1120,565 @@ class MuteManager:
             print(f"{member} 뮤트 해제 중 오류 발생: {str(e)}")
         return False
 
-    async def load_mutes(self, bot):
+    async def load_mutes(self, bot, shard_id: Optional[int] = None):
+        # 재연결마다 on_ready가 다시 불리므로 이미 복구 중이면 건너뛴다 (샤드별로 따로 잠근다)
+        lock = self._load_locks.setdefault(shard_id, asyncio.Lock())
+        if lock.locked():
+            print("재갈 복구가 이미 진행 중입니다.")
+            return None
+        async with lock:
+            guild_ids = None if shard_id is None else shard_guild_ids(shard_id)
+            return await self._reconcile_mutes(bot, guild_ids)
+
+    async def _reconcile_mutes(self, bot, guild_ids: Optional[List[int]] = None):
+        # guild_ids가 있으면 그 길드들(한 샤드)의 재갈만 복구한다
+        if hasattr(self.backend, 'resume_pending'):
+            await self.backend.resume_pending(bot, guild_ids)
+        started = time.monotonic()
         current_time = datetime.now()
-        async for mute in self.mute_collection.find():
-            guild = bot.get_guild(mute['guild_id'])
-            if guild:
-                member = guild.get_member(mute['user_id'])
-                if member:
+        stats = {'read': 0, 'scheduled': 0, 'rescheduled': 0, 'unchanged': 0, 'dropped': 0,
+                 'expired': 0, 'unmuted': 0, 'failed': 0}
+        seen = set()
+        queue = asyncio.Queue(maxsize=RECOVERY_CONCURRENCY * 2)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                try:
+                    if item is None:
+                        return
+                    guild, user_id = item
+                    # 만료된 멤버만 조회하므로 lean 캐시에서도 REST 호출은 해제 건수만큼만 생긴다
+                    member = await resolve_member(guild, user_id)
+                    if member is None:
+                        await self.store.delete_mute_task(guild.id, user_id)
+                    elif await self.unmute_user(member, guild):
+                        stats['unmuted'] += 1
+                except Exception as e:
+                    # 워커가 죽으면 큐가 막혀 복구 전체가 멈추므로 한 건씩 실패로 넘긴다
+                    stats['failed'] += 1
+                    print(f"{item[1]} 재갈 복구 중 오류 발생: {str(e)}")
+                finally:
+                    queue.task_done()
+
+        # 역할 수정은 디스코드 레이트 리밋에 걸리므로 동시에 몇 개만 처리한다
+        workers = [asyncio.create_task(worker()) for _ in range(RECOVERY_CONCURRENCY)]
+        try:
+            async for mute in self.store.iter_mute_tasks(guild_ids, RECOVERY_BATCH_SIZE):
+                stats['read'] += 1
+                if stats['read'] % RECOVERY_BATCH_SIZE == 0:
+                    print(f"재갈 복구 진행 중: {stats['read']}건 확인, {stats['expired']}건 해제 대기")
+
+                key = (mute['guild_id'], mute['user_id'])
+                seen.add(key)
+                guild = bot.get_guild(mute['guild_id'])
+                if guild:
+                    # 남은 예약은 id만으로 걸어두고 멤버는 만료 시점에 조회한다
                     end_time = mute['end_time']
                     if end_time > current_time:
-                        self.active_mutes[member.id] = asyncio.create_task(self.schedule_unmute(member, guild, end_time))
+                        # DB와 스케줄러가 다를 때만 예약을 바꾼다
+                        scheduled = self.scheduler.get(*key)
+                        check_at = self.backend.next_check(end_time)
+                        if scheduled is not None and (scheduled == check_at or
+                                                      (self.backend.platform_expiry and scheduled < end_time)):
+                            stats['unchanged'] += 1
+                        else:
+                            self.scheduler.schedule(guild.id, mute['user_id'], check_at)
+                            stats['rescheduled' if scheduled else 'scheduled'] += 1
                     else:
-                        await self.unmute_user(member, guild)
+                        stats['expired'] += 1
+                        await queue.put((guild, mute['user_id']))
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+        # DB에서 사라진 예약은 스케줄러에서도 제거
+        owned = None if guild_ids is None else set(guild_ids)
+        for key in self.scheduler.keys():
+            if key not in seen and (owned is None or key[0] in owned):
+                self.scheduler.cancel(*key)
+                stats['dropped'] += 1
+
+        elapsed = time.monotonic() - started
+        scope = "" if guild_ids is None else f"[길드 {len(guild_ids)}개] "
+        print(f"{scope}재갈 복구 완료: {stats['read']}건 확인, {stats['scheduled']}건 예약, "
+              f"{stats['rescheduled']}건 재예약, {stats['unchanged']}건 유지, {stats['dropped']}건 제거, "
+              f"{stats['unmuted']}/{stats['expired']}건 해제, {stats['failed']}건 실패 ({elapsed:.2f}초)")
+        return stats
+
+
+# 메모리 타이머가 놓친 만료(프로세스 중단, 다른 프로세스에서 건 재갈 등)를 DB에서 찾아 처리한다
+class ExpirySweeper:
+    def __init__(self, manager: MuteManager, interval: float, batch_size: int, grace: float, retry_interval: float):
+        self.manager = manager
+        self.interval = interval
+        self.batch_size = batch_size
+        self.grace = grace
+        self.retry_interval = retry_interval
+        # 해제하지 못한 행(멤버가 나감 등)은 잠시 건너뛰어 매번 REST를 부르지 않는다
+        self._attempted: Dict[Tuple[int, int], float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'sweeps': 0, 'expired': 0, 'last_ms': 0.0, 'last_lag_s': 0.0, 'max_lag_s': 0.0}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not leader_lease.is_leader:
+                continue
+            try:
+                await self.sweep()
+            except PyMongoError as e:
+                print(f"재갈 만료 점검 중 오류 발생: {str(e)}")
+
+    async def sweep(self) -> int:
+        started = time.monotonic()
+        # 타이머가 먼저 처리하도록 마감 직후 몇 초는 남겨둔다
+        cutoff = datetime.now() - timedelta(seconds=self.grace)
+        guild_ids = [guild.id for guild in bot.guilds] if SHARDED else None
+        semaphore = asyncio.Semaphore(RECOVERY_CONCURRENCY)
+        seen = set()
+        expired = 0
+        max_lag = 0.0
+        last = None
+
+        async def expire(key: Tuple[int, int], end_time: datetime):
+            async with semaphore:
+                self.manager.scheduler.cancel(*key)
+                await self.manager.expire_mute(*key)
+            return (datetime.now() - end_time).total_seconds()
+
+        while True:
+            # 처리하지 못한 행이 앞을 막지 않도록 (end_time, _id) 기준으로 넘겨가며 읽는다
+            batch = await self.manager.store.expired_mute_tasks(cutoff, guild_ids, last, self.batch_size)
+            if not batch:
+                break
+            last = (batch[-1]['end_time'], batch[-1]['_id'])
+            jobs = []
+            now = time.monotonic()
+            for mute in batch:
+                key = (mute['guild_id'], mute['user_id'])
+                seen.add(key)
+                if bot.get_guild(key[0]) is None or now - self._attempted.get(key, -self.retry_interval) < self.retry_interval:
+                    continue
+                self._attempted[key] = now
+                jobs.append(expire(key, mute['end_time']))
+            for lag in await asyncio.gather(*jobs):
+                max_lag = max(max_lag, lag)
+            expired += len(jobs)
+            if len(batch) < self.batch_size:
+                break
+
+        # DB에서 사라진 행은 기억할 필요가 없다
+        self._attempted = {key: at for key, at in self._attempted.items() if key in seen}
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.stats['sweeps'] += 1
+        self.stats['expired'] += expired
+        self.stats['last_ms'] = round(elapsed_ms, 1)
+        if expired:
+            self.stats['last_lag_s'] = round(max_lag, 1)
+            self.stats['max_lag_s'] = max(self.stats['max_lag_s'], round(max_lag, 1))
+            print(f"재갈 만료 점검: {expired}건 처리, 마감 대비 최대 {max_lag:.1f}초 지연 ({elapsed_ms:.0f}ms)")
+        return expired
+
+
+# 컬렉션별 인덱스 (명령어 쿼리가 길드 안에서 user_id로 조회하므로 guild_id, user_id를 앞에 둔다)
+INDEX_SPECS = {
+    'moderation_events': [
+        [('guild_id', 1), ('user_id', 1), ('type', 1), ('timestamp', -1), ('_id', -1)],
+        # 역방향으로 읽으면 전체 보기의 (timestamp, _id) 내림차순 정렬에도 쓴다
+        [('guild_id', 1), ('user_id', 1), ('timestamp', 1), ('_id', 1)],
+    ],
+    'user_roles': [
+        ([('guild_id', 1), ('user_id', 1)], {'unique': True}),
+        [('user_id', 1)],
+    ],
+    'mute_tasks': [
+        ([('guild_id', 1), ('user_id', 1)], {'unique': True}),
+        # 만료 점검이 (end_time, _id) 순으로 넘겨가며 읽으므로 _id까지 넣는다
+        [('end_time', 1), ('_id', 1)],
+        [('guild_id', 1), ('end_time', 1), ('_id', 1)],
+    ],
+    'guild_config': [
+        ([('guild_id', 1)], {'unique': True}),
+        [('updated_at', 1)],
+    ],
+    'user_stats': [
+        ([('guild_id', 1), ('user_id', 1)], {'unique': True}),
+    ],
+}
+
+# 명령어가 실제로 보내는 쿼리 모양 (이름, 컬렉션, 필터, 정렬)
+QUERY_SHAPES = [
+    ("로그 / get_recent_events (전체)", 'moderation_events', {'guild_id': 0, 'user_id': 0}, [('timestamp', -1), ('_id', -1)]),
+    ("로그 / get_log_page (종류별)", 'moderation_events', {'guild_id': 0, 'user_id': 0, 'type': 'warning'},
+     [('timestamp', -1), ('_id', -1)]),
+    ("카운터 재계산 / rebuild_user_stats", 'moderation_events', {'guild_id': 0, 'user_id': 0}, [('timestamp', 1)]),
+    ("경고 / 재갈 / 추방 / get_user_stats", 'user_stats', {'guild_id': 0, 'user_id': 0}, None),
+    ("재갈풀기 / user_roles 조회", 'user_roles', {'user_id': 0, 'guild_id': {'$in': [0, None]}}, None),
+    # 재갈 복구(iter_mute_tasks)는 만료 여부와 상관없이 예약을 모두 읽는다
+    ("재갈 복구 / iter_mute_tasks", 'mute_tasks', {}, None),
+    ("재갈 복구 / iter_mute_tasks (샤드)", 'mute_tasks', {'guild_id': {'$in': [0]}}, None),
+    ("만료 점검 / ExpirySweeper", 'mute_tasks', {'end_time': {'$lte': datetime(1970, 1, 1)}},
+     [('end_time', 1), ('_id', 1)]),
+    ("만료 점검 / ExpirySweeper (샤드)", 'mute_tasks',
+     {'guild_id': {'$in': [0]}, 'end_time': {'$lte': datetime(1970, 1, 1)}}, [('end_time', 1), ('_id', 1)]),
+]
+
+_indexes_ready = False
+
+
+async def ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    for collection_name, specs in INDEX_SPECS.items():
+        for spec in specs:
+            keys, options = spec if isinstance(spec, tuple) else (spec, {})
+            try:
+                await db[collection_name].create_index(keys, **options)
+            except Exception as e:
+                print(f"{collection_name} 인덱스 생성 중 오류 발생: {str(e)}")
+    _indexes_ready = True
+    print("인덱스 확인 완료")
+
+
+def _plan_stages(plan: Dict) -> List[str]:
+    stages = [plan.get('stage', '')]
+    if 'inputStage' in plan:
+        stages += _plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def check_indexes() -> List[str]:
+    uncovered = []
+    for name, collection_name, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain['queryPlanner']['winningPlan'])
+        if 'COLLSCAN' in stages and not query:
+            # 필터가 없는 쿼리는 원래 컬렉션 전체를 읽는다
+            print(f"[OK] {name} (전체 읽기)")
+            continue
+        if 'COLLSCAN' in stages:
+            problem = "컬렉션 전체 스캔"
+        elif 'SORT' in stages:
+            problem = "메모리 정렬"
+        else:
+            print(f"[OK] {name}")
+            continue
+        uncovered.append(name)
+        print(f"[미적용] {name}: {problem} ({' <- '.join(s for s in stages if s)})")
+    print(f"인덱스 점검 완료: {len(QUERY_SHAPES) - len(uncovered)}/{len(QUERY_SHAPES)}개 쿼리 적용")
+    return uncovered
+
+
+async def prepare():
+    # 샤드마다 준비 이벤트가 오므로 공용 초기화는 한 번만 한다
+    global prepared
+    async with prepare_lock:
+        if prepared:
+            return
+        # 저널 복구는 명령어가 기록을 쓰기 전에 가장 먼저 한다
+        if _MULTI_PROCESS and not os.getenv("INSTANCE_ID") and not os.getenv("LOG_JOURNAL_PATH"):
+            print(f"INSTANCE_ID가 없어 저널 이름({LOG_JOURNAL_PATH})이 재시작마다 바뀝니다. "
+                  "꺼질 때 남은 기록을 다시 읽으려면 INSTANCE_ID를 고정하세요.")
+        await log_writer.start()
+        if isinstance(store, MotorStorage):
+            await ensure_indexes()
+        await guild_configs.load()
+        await leader_lease.start()
+        if CHANGE_STREAMS:
+            change_sync.start()
+        expiry_sweeper.start()
+        prepared = True
+
+
+async def recover_mutes():
+    # 리더가 된 프로세스는 맡은 샤드의 재갈을 모두 다시 읽는다
+    if SHARDED:
+        for shard_id in bot.shards:
+            await mute_manager.load_mutes(bot, shard_id)
+    else:
+        await mute_manager.load_mutes(bot)
 
 
 @bot.event
 async def on_ready():
     print("Bot is Ready!")
-    await mute_manager.load_mutes(bot)
+    await prepare()
+    if not SHARDED and leader_lease.is_leader:
+        await mute_manager.load_mutes(bot)
+    print_resource_report("startup")
+    global resource_report_task
+    if resource_report_task is None:
+        resource_report_task = asyncio.create_task(resource_report_loop())
+
+
+# raw 이벤트는 캐시에 없는 멤버의 변경도 받는다
+@bot.event
+async def on_raw_member_update(member: disnake.Member):
+    shard_metrics.record_event(member.guild.id)
+    authorizer.invalidate(member.guild.id, member.id)
+
+
+@bot.event
+async def on_raw_member_remove(payload: disnake.RawGuildMemberRemoveEvent):
+    shard_metrics.record_event(payload.guild_id)
+    authorizer.invalidate(payload.guild_id, payload.user.id)
+
+
+@bot.listen("on_interaction")
+async def on_interaction_metrics(inter: disnake.Interaction):
+    if inter.guild_id:
+        shard_metrics.record_event(inter.guild_id)
+
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    # 샤드는 자기 길드의 재갈만 guild_id로 조회해 복구한다
+    shard_metrics.record_state(shard_id, 'ready')
+    await prepare()
+    if leader_lease.is_leader:
+        await mute_manager.load_mutes(bot, shard_id)
+
+
+@bot.event
+async def on_shard_connect(shard_id: int):
+    shard_metrics.record_state(shard_id, 'connect')
+
+
+@bot.event
+async def on_shard_disconnect(shard_id: int):
+    shard_metrics.record_state(shard_id, 'disconnect')
+
+
+@bot.event
+async def on_shard_resumed(shard_id: int):
+    shard_metrics.record_state(shard_id, 'resume')
+
+
+def shard_of(guild_id: int) -> int:
+    # 디스코드 샤딩 공식: (guild_id >> 22) % shard_count
+    return (guild_id >> 22) % (bot.shard_count or 1)
+
+
+def shard_guild_ids(shard_id: int) -> List[int]:
+    return [guild.id for guild in bot.guilds if shard_of(guild.id) == shard_id]
+
+
+class ShardMetrics:
+    STATES = ('ready', 'connect', 'disconnect', 'resume')
+
+    def __init__(self):
+        self.events: Dict[int, int] = {}
+        self.states: Dict[int, Dict[str, int]] = {}
+
+    def record_event(self, guild_id: int):
+        shard_id = shard_of(guild_id)
+        self.events[shard_id] = self.events.get(shard_id, 0) + 1
+
+    def record_state(self, shard_id: int, state: str):
+        counts = self.states.setdefault(shard_id, dict.fromkeys(self.STATES, 0))
+        counts[state] += 1
+
+    def info(self) -> List[Dict]:
+        latencies = bot.latencies if SHARDED else [(0, bot.latency)]
+        guild_counts: Dict[int, int] = {}
+        for guild in bot.guilds:
+            shard_id = shard_of(guild.id)
+            guild_counts[shard_id] = guild_counts.get(shard_id, 0) + 1
+        return [
+            {'shard': shard_id,
+             'latency_ms': round(latency * 1000, 1) if latency == latency else None,
+             'guilds': guild_counts.get(shard_id, 0),
+             'events': self.events.get(shard_id, 0),
+             **self.states.get(shard_id, dict.fromkeys(self.STATES, 0))}
+            for shard_id, latency in latencies
+        ]
+
+
+async def resolve_member(guild: disnake.Guild, user_id: int) -> Optional[disnake.Member]:
+    # lean 캐시에서는 캐시에 없으면 REST로 조회한다
+    member = guild.get_member(user_id)
+    if member is not None:
+        return member
+    try:
+        return await call_with_retry(lambda: guild.fetch_member(user_id))
+    except disnake.NotFound:
+        return None
 
-# MuteManager 인스턴스 생성
-mute_manager = MuteManager(db)
 
+def resource_usage() -> Dict:
+    rss = None
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            # 리눅스 외에서는 최대 RSS(KB)로 대신한다
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            pass
+    return {
+        'rss_mb': round(rss / 1024 / 1024, 1) if rss is not None else None,
+        'cpu_seconds': round(time.process_time(), 2),
+        'guilds': len(bot.guilds),
+        'cached_members': sum(len(guild.members) for guild in bot.guilds),
+    }
+
+
+def report_fields(info: Dict) -> str:
+    return " ".join(f"{key}={round(value, 4) if isinstance(value, float) else value}" for key, value in info.items())
+
+
+def print_resource_report(label: str):
+    usage = resource_usage()
+    print(f"[리소스] {label} intents={INTENTS_PROFILE} member_cache={MEMBER_CACHE_POLICY} "
+          + " ".join(f"{key}={value}" for key, value in usage.items()))
+    scheduler = mute_manager.scheduler
+    print(f"[재갈 예약] queue_depth={scheduler.queue_depth} in_flight={scheduler.in_flight} "
+          f"next_deadline={scheduler.next_deadline}")
+    print("[대상 락] " + report_fields(target_locks.info()))
+    print("[요약 캐시] " + report_fields(summary_cache.info()))
+    for name, info in command_metrics.info().items():
+        print(f"[명령어] {name} " + report_fields(info))
+    for shard in shard_metrics.info():
+        print("[샤드] " + " ".join(f"{key}={value}" for key, value in shard.items()))
+    print("[만료 점검] " + " ".join(f"{key}={value}" for key, value in expiry_sweeper.stats.items()))
+    if CHANGE_STREAMS:
+        print("[동기화] " + " ".join(f"{key}={value}" for key, value in change_sync.stats.items()))
+    if leader_lease.enabled:
+        asyncio.create_task(print_lease_report())
+
+
+async def print_lease_report():
+    try:
+        info = await leader_lease.info()
+    except PyMongoError as e:
+        print(f"리더 리스 조회 중 오류 발생: {str(e)}")
+        return
+    print(f"[리더] {leader_lease.name} instance={INSTANCE_ID} " + " ".join(f"{key}={value}" for key, value in info.items()))
+
+
+async def resource_report_loop():
+    while True:
+        await asyncio.sleep(RESOURCE_REPORT_INTERVAL)
+        print_resource_report("steady")
 
-class LogPaginator(disnake.ui.View):
-    def __init__(self, logs: List[Dict], category: str, timeout: float = 180.0):
-        super().__init__(timeout=timeout)
-        self.logs = logs
-        self.category = category
-        self.page = 0
-        self.max_page = (len(logs) - 1) // 5
 
-    @disnake.ui.button(label="◀️", style=disnake.ButtonStyle.blurple)
-    async def prev_page(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        self.page = max(0, self.page - 1)
-        await self.update_message(inter)
+# MuteManager 인스턴스 생성
+guild_configs = GuildConfigCache(store, GUILD_CONFIG_REFRESH_INTERVAL)
+authorizer = AdminAuthorizer()
+mute_manager = MuteManager(store, bot, MUTE_BACKENDS[MUTE_BACKEND]())
+summary_cache = SummaryCache(SUMMARY_CACHE_SIZE, SUMMARY_CACHE_TTL)
+target_locks = KeyedLock()
+resource_report_task = None
+shard_metrics = ShardMetrics()
+expiry_sweeper = ExpirySweeper(mute_manager, SWEEP_INTERVAL, SWEEP_BATCH_SIZE, SWEEP_GRACE, SWEEP_RETRY_INTERVAL)
+change_sync = ChangeStreamSync(db, stream_tokens_collection, STREAM_TOKEN_ID, STREAM_TOKEN_SAVE_INTERVAL)
+leader_lease = LeaderLease(
+    leases_collection, "mute_expiry" + (f":{','.join(map(str, SHARD_IDS))}" if SHARD_IDS else ""), INSTANCE_ID,
+    LEASE_TTL, LEASE_RENEW_INTERVAL, enabled=LEADER_LEASE, on_acquire=recover_mutes
+)
+prepare_lock = asyncio.Lock()
+prepared = False
+log_writer = LogWriter(store, LOG_JOURNAL_PATH, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL)
+
+
+# /로그 페이지 버튼은 상태를 custom_id에 담아 재시작 후에도 동작한다
+# 형식: log:{방향}:{길드 ID}:{유저 ID}:{type}:{페이지}:{timestamp(ms)}:{_id}
+LOG_PAGE_PREFIX = "log:"
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_log_cursor(direction: str, guild_id: int, user_id: int, event_type: str, page: int, entry: Dict) -> str:
+    timestamp = entry.get('timestamp')
+    millis = (timestamp - _EPOCH) // timedelta(milliseconds=1) if isinstance(timestamp, datetime) else ""
+    return f"{LOG_PAGE_PREFIX}{direction}:{guild_id}:{user_id}:{event_type}:{page}:{millis}:{entry['_id']}"
+
+
+def decode_log_cursor(custom_id: str) -> Tuple[str, Optional[int], int, str, int, Tuple]:
+    fields = custom_id[len(LOG_PAGE_PREFIX):].split(":")
+    if len(fields) == 6:
+        # 길드 ID가 없던 예전 버튼
+        fields.insert(1, "")
+    direction, guild_id, user_id, event_type, page, millis, entry_id = fields
+    timestamp = _EPOCH + timedelta(milliseconds=int(millis)) if millis else None
+    return (direction, int(guild_id) if guild_id else None, int(user_id), event_type, int(page),
+            (timestamp, ObjectId(entry_id)))
+
+
+def build_log_page(guild_id: int, user_id: int, event_type: str, page: int, logs: List[Dict],
+                   total: int) -> Tuple[disnake.Embed, List[disnake.ui.Button]]:
+    category = EVENT_CATEGORIES.get(event_type, event_type)
+    max_page = max(0, (total - 1) // LOG_PAGE_SIZE, page)
+    embed = disnake.Embed(title=f"{category} 기록", color=disnake.Color.red())
+
+    for log in logs:
+        timestamp = get_timestamp(log)
+        reason = log.get('reason', '사유 없음')
+        action = log.get('action', 'unknown')
+        action_text = '추가' if action == 'add' else '삭제' if action == 'remove' else action
+        embed.add_field(name=f"{timestamp} ({action_text})", value=reason, inline=False)
+
+    embed.set_footer(text=f"페이지 {page + 1}/{max_page + 1}")
+
+    has_next = len(logs) >= LOG_PAGE_SIZE and (page + 1) * LOG_PAGE_SIZE < total
+    components = [
+        disnake.ui.Button(label="◀️", style=disnake.ButtonStyle.blurple, disabled=page == 0,
+                          custom_id=encode_log_cursor("prev", guild_id, user_id, event_type, page, logs[0])),
+        disnake.ui.Button(label="▶️", style=disnake.ButtonStyle.blurple, disabled=not has_next,
+                          custom_id=encode_log_cursor("next", guild_id, user_id, event_type, page, logs[-1])),
+        disnake.ui.Button(label="메시지 삭제", style=disnake.ButtonStyle.red,
+                          custom_id=f"{LOG_PAGE_PREFIX}delete"),
+    ]
+    return embed, components
 
-    @disnake.ui.button(label="▶️", style=disnake.ButtonStyle.blurple)
-    async def next_page(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        self.page = min(self.max_page, self.page + 1)
-        await self.update_message(inter)
 
-    @disnake.ui.button(label="메시지 삭제", style=disnake.ButtonStyle.red)
-    async def delete_message(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+@bot.listen("on_button_click")
+async def on_log_page_click(inter: disnake.MessageInteraction):
+    custom_id = inter.component.custom_id or ""
+    if not custom_id.startswith(LOG_PAGE_PREFIX):
+        return
+    # 로그 메시지는 누구나 볼 수 있으니 버튼도 관리자만 누를 수 있게 한다
+    if not await require_admin(inter):
+        return
+
+    if custom_id == f"{LOG_PAGE_PREFIX}delete":
         await inter.response.defer()
         await inter.delete_original_message()
-        self.stop()
-
-    async def update_message(self, inter: disnake.MessageInteraction):
-        embed = self.create_embed()
-        await inter.response.edit_message(embed=embed, view=self)
+        return
 
-    def create_embed(self) -> disnake.Embed:
-        embed = disnake.Embed(title=f"{self.category} 기록", color=disnake.Color.red())
+    direction, guild_id, user_id, event_type, page, cursor = decode_log_cursor(custom_id)
+    if guild_id is None:
+        guild_id = inter.guild.id
+    elif guild_id != inter.guild.id:
+        await inter.response.defer()
+        return
+    if direction == "next":
+        logs = await get_log_page(guild_id, user_id, event_type, after=cursor)
+        page += 1
+    else:
+        logs = await get_log_page(guild_id, user_id, event_type, before=cursor)
+        page = max(0, page - 1)
 
-        start = self.page * 5
-        end = start + 5
-        for log in self.logs[start:end]:
-            timestamp = get_timestamp(log)
-            reason = log.get('reason', '사유 없음')
-            action = log.get('action', 'unknown')
-            action_text = '추가' if action == 'add' else '삭제' if action == 'remove' else action
-            embed.add_field(name=f"{timestamp} ({action_text})", value=reason, inline=False)
+    if not logs:
+        await inter.response.defer()
+        return
 
-        embed.set_footer(text=f"페이지 {self.page + 1}/{self.max_page + 1}")
-        return embed
+    stats = await get_user_stats(guild_id, user_id)
+    embed, components = build_log_page(guild_id, user_id, event_type, page, logs, stats.get('events', {}).get(event_type, 0))
+    await inter.response.edit_message(embed=embed, components=components)
 
 
 def get_timestamp(entry: Dict) -> str:
@@ -206,61 +1689,180 @@ def get_timestamp(entry: Dict) -> str:
     return timestamp.strftime('%Y-%m-%d %H:%M:%S') if isinstance(timestamp, datetime) else str(timestamp)
 
 
-def create_all_log_embed(member: disnake.Member, warnings: List[Dict], mutes: List[Dict], kicks: List[Dict],
-                         bans: List[Dict]) -> disnake.Embed:
+def create_all_log_embed(member: disnake.Member, recent: Dict[str, List[Dict]], counts: Dict[str, int]) -> disnake.Embed:
     embed = disnake.Embed(title=f"{member.name}의 처벌 기록", color=disnake.Color.red())
 
     categories = [
-        ("경고", warnings, disnake.Color.yellow()),
-        ("재갈", mutes, disnake.Color.orange()),
-        ("퇴출", kicks, disnake.Color.red()),
-        ("사형", bans, disnake.Color.dark_red())
+        ("경고", 'warning', disnake.Color.yellow()),
+        ("재갈", 'mute', disnake.Color.orange()),
+        ("퇴출", 'kick', disnake.Color.red()),
+        ("사형", 'ban', disnake.Color.dark_red())
     ]
 
-    for category, logs, color in categories:
+    for category, event_type, color in categories:
+        logs = recent.get(event_type, [])
         log_text = ""
-        for log in logs[:3]:  # 각 카테고리당 3개씩만 표시
+        for log in logs[:RECENT_EVENTS_PER_TYPE]:  # 각 카테고리당 3개씩만 표시
             timestamp = get_timestamp(log)
             reason = log.get('reason', '사유 없음')
             action = log.get('action', 'unknown')
             action_text = '추가' if action == 'add' else '삭제' if action == 'remove' else action
             log_text += f"• {timestamp} ({action_text}): {reason}\n"
-        embed.add_field(name=f"{category} ({len(logs)}건)", value=log_text or "기록 없음", inline=False)
+        count = max(counts.get(event_type, 0), len(logs))
+        embed.add_field(name=f"{category} ({count}건)", value=log_text or "기록 없음", inline=False)
 
     return embed
 
 
-async def add_kick_log(member: disnake.Member, reason: str, kicked_by: disnake.Member):
-    await kick_logs_collection.insert_one({
-        'user_id': member.id,
-        'username': member.name,
-        'guild_id': member.guild.id,
+async def add_event(event_type: str, action: str, user: disnake.abc.User, guild_id: int, reason: str,
+                    by: disnake.abc.User, inc: Dict[str, int] = None, condition: Dict = None, **extra) -> Dict:
+    event = {
+        'type': event_type,
+        'action': action,
+        'user_id': user.id,
+        'username': user.name,
+        'guild_id': guild_id,
         'reason': reason,
-        'kicked_at': datetime.now(),
-        'kicked_by': {
-            'id': kicked_by.id,
-            'name': kicked_by.name
-        }
-    })
+        'timestamp': datetime.now(),
+        'by': {
+            'id': by.id,
+            'name': by.name
+        },
+        **extra
+    }
+    await log_writer.write(event)
+    return await bump_user_stats(guild_id, user.id, {f'events.{event_type}': 1, **(inc or {})}, condition)
+
+
+async def add_kick_log(member: disnake.Member, reason: str, kicked_by: disnake.Member) -> Dict:
+    return await add_event('kick', 'kick', member, member.guild.id, reason, kicked_by, inc={'kicks': 1})
+
+
+async def add_ban_log(user: disnake.User, guild: disnake.Guild, reason: str, banned_by: disnake.Member) -> Dict:
+    return await add_event('ban', 'ban', user, guild.id, reason, banned_by, inc={'bans': 1})
 
 
 async def add_mute_log(member: disnake.Member, guild: disnake.Guild, reason: str, end_time: datetime,
-                       muted_by: disnake.Member, count_mute: bool = True):
-    mute_log = {
-        'user_id': member.id,
-        'username': member.name,
-        'guild_id': guild.id,
-        'reason': reason,
-        'muted_at': datetime.now(),
-        'end_time': end_time,
-        'muted_by': {
-            'id': muted_by.id,
-            'name': muted_by.name
-        },
-        'action': 'mute' if count_mute else 'temp_mute'
+                       muted_by: disnake.Member, count_mute: bool = True) -> Dict:
+    action = 'mute' if count_mute else 'temp_mute'
+    inc = {'mutes': 1} if count_mute else None
+    return await add_event('mute', action, member, guild.id, reason, muted_by, inc=inc, end_time=end_time)
+
+
+async def apply_escalation(actions: List["EscalationRule"], member: disnake.Member, guild: disnake.Guild,
+                           moderator: disnake.Member) -> List[str]:
+    messages = []
+    for rule in actions:
+        print(f"{member.id} {rule.reason}으로 {rule.action} 처리")
+        if rule.action == 'mute':
+            end_time = datetime.now() + rule.duration
+            await mute_user_with_reason(member, guild, rule.reason, end_time, moderator)
+            await add_mute_log(member, guild, rule.reason, end_time, moderator)
+        elif rule.action == 'kick':
+            await member.kick(reason=rule.reason)
+            await add_kick_log(member, rule.reason, moderator)
+        elif rule.action == 'ban':
+            await guild.ban(member, reason=rule.reason)
+            await add_ban_log(member, guild, rule.reason, moderator)
+        messages.append(rule.message)
+    return messages
+
+
+# 명령어별 실행 횟수, 결과, 지연 시간
+class CommandMetrics:
+    def __init__(self, window: int = 256):
+        self.window = window
+        self._commands: Dict[str, Dict] = {}
+
+    def record(self, name: str, elapsed: float, outcome: str):
+        entry = self._commands.get(name)
+        if entry is None:
+            entry = self._commands[name] = {'count': 0, 'outcomes': {}, 'total': 0.0, 'max': 0.0,
+                                            'recent': deque(maxlen=self.window)}
+        entry['count'] += 1
+        entry['outcomes'][outcome] = entry['outcomes'].get(outcome, 0) + 1
+        entry['total'] += elapsed
+        entry['max'] = max(entry['max'], elapsed)
+        entry['recent'].append(elapsed)
+
+    def info(self) -> Dict[str, Dict]:
+        result = {}
+        for name, entry in self._commands.items():
+            recent = sorted(entry['recent'])
+            result[name] = {
+                'count': entry['count'],
+                'outcomes': dict(entry['outcomes']),
+                'avg': entry['total'] / entry['count'],
+                'p95': recent[int(len(recent) * 0.95) - 1] if len(recent) >= 20 else recent[-1],
+                'max': entry['max'],
+            }
+        return result
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, commands.errors.CommandInvokeError):
+        error = error.original
+    if isinstance(error, disnake.Forbidden):
+        return 'forbidden'
+    if isinstance(error, disnake.NotFound):
+        return 'not_found'
+    if isinstance(error, disnake.HTTPException):
+        return 'rate_limited' if error.status == 429 else 'discord_error'
+    if isinstance(error, PyMongoError):
+        return 'db_error'
+    if isinstance(error, ValueError):
+        return 'invalid_input'
+    return 'internal'
+
+
+def log_command(inter: disnake.ApplicationCommandInteraction, outcome: str, elapsed: float, error: Exception = None):
+    fields = {
+        'command': inter.application_command.qualified_name if inter.application_command else None,
+        'guild': inter.guild.id if inter.guild else None,
+        'user': inter.author.id,
+        'outcome': outcome,
+        'elapsed_ms': round(elapsed * 1000, 1),
     }
-    await mute_logs_collection.insert_one(mute_log)
-    return await get_punishment_counts(member.id)
+    if error is not None:
+        fields['error'] = str(error)
+    print("[명령어] " + " ".join(f"{key}={value}" for key, value in fields.items()))
+
+
+async def send_error(inter: disnake.ApplicationCommandInteraction, message: str):
+    if not inter.response.is_done():
+        await inter.response.send_message(message, ephemeral=True)
+    else:
+        await inter.followup.send(message, ephemeral=True)
+
+
+def moderation_command(admin: bool = True, defer: bool = True, ephemeral: bool = False,
+                       error_message: str = "명령어 실행 중 오류가 발생했습니다", bootstrap: bool = False):
+    # 권한 확인, defer, 지연 시간 측정, 오류 처리, 로그를 모든 명령어에 한 번에 적용한다
+    # bootstrap이면 관리자 역할이 아직 없는 서버에서 서버 관리자 권한으로도 실행할 수 있다 (/설정 전용)
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(inter: disnake.ApplicationCommandInteraction, *args, **kwargs):
+            started = time.perf_counter()
+            outcome, error = 'ok', None
+            try:
+                if admin and not await require_admin(inter, bootstrap):
+                    outcome = 'denied'
+                    return
+                if defer:
+                    await inter.response.defer(ephemeral=ephemeral)
+                await func(inter, *args, **kwargs)
+            except Exception as e:
+                outcome, error = classify_error(e), e
+                await send_error(inter, f"{error_message}: {str(e)}")
+            finally:
+                elapsed = time.perf_counter() - started
+                command_metrics.record(func.__name__, elapsed, outcome)
+                log_command(inter, outcome, elapsed, error)
+        return wrapper
+    return decorator
+
+
+command_metrics = CommandMetrics()
 
 
 """
@@ -279,340 +1881,352 @@ async def add_mute_log(member: disnake.Member, guild: disnake.Guild, reason: str
 
 
 @bot.slash_command(name="경고", description="사용자에게 경고를 줍니다.")
+@moderation_command()
 async def warn(inter: disnake.ApplicationCommandInteraction, 멤버: disnake.Member, 사유: str):
-    await inter.response.defer()
-
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
-        return
-
-    warning_count, mute_count = await add_warning(멤버, inter.guild, 사유, inter.author)
-    response = f"{멤버.mention}님에게 경고를 주었습니다. 사유: {사유}\n현재 경고 횟수: {warning_count}, 재갈 횟수: {mute_count}"
+    async with target_locks.hold((inter.guild.id, 멤버.id)):
+        stats = await add_warning(멤버, inter.guild, 사유, inter.author)
+        response = f"{멤버.mention}님에게 경고를 주었습니다. 사유: {사유}\n현재 경고 횟수: {stats['warnings_added']}, 재갈 횟수: {stats['mutes']}"
 
-    if warning_count % 3 == 0:
-        mute_duration = timedelta(days=1)
-        end_time = datetime.now() + mute_duration
-        await mute_user_with_reason(멤버, inter.guild, "경고 3회 누적", end_time, inter.author)
-        warning_count, mute_count = await add_mute_log(멤버, inter.guild, "경고 3회 누적", end_time, inter.author)
-        response += f"\n경고 3회 누적으로 1일 재갈 처리되었습니다."
-
-        if mute_count % 3 == 0:
-            kick_reason = "뮤트 3회 누적"
-            await 멤버.kick(reason=kick_reason)
-            await add_kick_log(멤버, kick_reason, inter.author)
-            response += f"\n재갈 3회 누적으로 퇴출 처리되었습니다."
+        actions = get_escalation_policy(inter.guild.id).evaluate(stats, 'warnings_added')
+        for message in await apply_escalation(actions, 멤버, inter.guild, inter.author):
+            response += f"\n{message}"
 
     await inter.followup.send(response)
 
 
 @bot.slash_command(name="경고삭제", description="사용자의 경고를 삭제합니다.")
+@moderation_command()
 async def remove_warning(inter: disnake.ApplicationCommandInteraction, 멤버: disnake.Member, 사유: str):
-    await inter.response.defer()
-
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
-        return
-
-    warning_count = await get_warning_count(멤버.id)
-    if warning_count == 0:
-        await inter.followup.send(f"{멤버.mention}님은 경고가 없습니다.")
-        return
-
-    await warnings_collection.insert_one({
-        'user_id': 멤버.id,
-        'username': 멤버.name,
-        'guild_id': inter.guild.id,
-        'reason': f"경고 삭제: {사유}",
-        'warned_at': datetime.now(),
-        'warned_by': {
-            'id': inter.author.id,
-            'name': inter.author.name
-        },
-        'action': 'remove'
-    })
+    async with target_locks.hold((inter.guild.id, 멤버.id)):
+        warning_count = await get_warning_count(inter.guild.id, 멤버.id)
+        if warning_count == 0:
+            await inter.followup.send(f"{멤버.mention}님은 경고가 없습니다.")
+            return
 
-    new_warning_count = await get_warning_count(멤버.id)
+        stats = await add_event('warning', 'remove', 멤버, inter.guild.id, f"경고 삭제: {사유}", inter.author,
+                                inc={'warnings': -1}, condition={'warnings': {'$gt': 0}})
+        new_warning_count = stats['warnings']
     await inter.followup.send(f"{멤버.mention}님의 경고를 1회 삭제했습니다. 사유: {사유}\n현재 경고 수: {new_warning_count}")
 
 
 @bot.slash_command(name="재갈", description="특정 사용자를 뮤트합니다.")
+@moderation_command(error_message="뮤트 중 오류가 발생했습니다")
 async def mute(inter: disnake.ApplicationCommandInteraction, 멤버: disnake.Member, 뮤트시간: str, 사유: str):
-    await inter.response.defer()
-
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
+    duration = parse_duration(뮤트시간)
+    if duration is None:
+        await inter.followup.send("재갈 시간 형식이 올바르지 않습니다. 예: 1h30m, 2d, 45m", ephemeral=True)
         return
 
-    try:
-        duration = parse_duration(뮤트시간)
-        if duration is None:
-            await inter.followup.send("재갈 시간 형식이 올바르지 않습니다. 예: 1h30m, 2d, 45m", ephemeral=True)
-            return
-
+    async with target_locks.hold((inter.guild.id, 멤버.id)):
         end_time = datetime.now() + duration
         await mute_user_with_reason(멤버, inter.guild, 사유, end_time, inter.author)
-        warning_count, mute_count = await add_mute_log(멤버, inter.guild, 사유, end_time, inter.author)
+        stats = await add_mute_log(멤버, inter.guild, 사유, end_time, inter.author)
 
-        response = f"{멤버.mention}님을 {format_duration(duration)} 동안 입을 막아놨습니다. 사유: {사유}\n현재 경고 횟수: {warning_count}, 재갈 횟수: {mute_count}"
+        response = f"{멤버.mention}님을 {format_duration(duration)} 동안 입을 막아놨습니다. 사유: {사유}\n현재 경고 횟수: {stats['warnings_added']}, 재갈 횟수: {stats['mutes']}"
 
-        if mute_count % 3 == 0:
-            kick_reason = "뮤트 3회 누적"
-            await 멤버.kick(reason=kick_reason)
-            await add_kick_log(멤버, kick_reason, inter.author)
-            response += f"\n재갈 3회 누적으로 퇴출 처리되었습니다."
+        actions = get_escalation_policy(inter.guild.id).evaluate(stats, 'mutes')
+        for message in await apply_escalation(actions, 멤버, inter.guild, inter.author):
+            response += f"\n{message}"
 
-        await inter.followup.send(response)
-
-    except Exception as e:
-        await inter.followup.send(f"뮤트 중 오류가 발생했습니다: {str(e)}", ephemeral=True)
+    await inter.followup.send(response)
 
 
 @bot.slash_command(name="경고재갈", description="특정 사용자에게 경고를 주고 뮤트합니다 (뮤트 카운트 증가 없음).")
+@moderation_command(error_message="경고재갈 처리 중 오류가 발생했습니다")
 async def warn_and_mute(inter: disnake.ApplicationCommandInteraction, 멤버: disnake.Member, 뮤트시간: str, 사유: str):
-    await inter.response.defer()
-
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
+    duration = parse_duration(뮤트시간)
+    if duration is None:
+        await inter.followup.send("재갈 시간 형식이 올바르지 않습니다. 예: 1h30m, 2d, 45m", ephemeral=True)
         return
 
-    try:
-        duration = parse_duration(뮤트시간)
-        if duration is None:
-            await inter.followup.send("재갈 시간 형식이 올바르지 않습니다. 예: 1h30m, 2d, 45m", ephemeral=True)
-            return
-
+    async with target_locks.hold((inter.guild.id, 멤버.id)):
         # 경고 추가
-        warning_count, mute_count = await add_warning(멤버, inter.guild, f"경고재갈: {사유}", inter.author)
-
-        # 경고 3회 누적 체크
-        if warning_count % 3 == 0:
-            duration = timedelta(days=1)  # 24시간 뮤트
-            end_time = datetime.now() + duration
-            await mute_user_with_reason(멤버, inter.guild, "경고 3회 누적", end_time, inter.author)
-            await add_mute_log(멤버, inter.guild, "경고 3회 누적", end_time, inter.author, count_mute=True)
-            response = f"{멤버.mention}님의 경고가 3회 누적되어 24시간 동안 재갈 처리되었습니다. 사유: 경고 3회 누적\n현재 경고 횟수: {warning_count}, 재갈 횟수: {mute_count + 1}"
+        stats = await add_warning(멤버, inter.guild, f"경고재갈: {사유}", inter.author)
+        warning_count, mute_count = stats['warnings_added'], stats['mutes']
+
+        # 경고 누적으로 재갈이 걸리면 입력한 시간 대신 정책의 재갈을 적용한다
+        actions = get_escalation_policy(inter.guild.id).evaluate(stats, 'warnings_added')
+        if actions and actions[0].action == 'mute':
+            rule = actions[0]
+            response = f"{멤버.mention}님의 경고가 {rule.every}회 누적되어 {format_duration(rule.duration)} 동안 재갈 처리되었습니다. 사유: {rule.reason}\n현재 경고 횟수: {warning_count}, 재갈 횟수: {mute_count + 1}"
+            messages = await apply_escalation(actions, 멤버, inter.guild, inter.author)
+            for message in messages[1:]:
+                response += f"\n{message}"
         else:
             # 일반적인 경고재갈 처리
             end_time = datetime.now() + duration
             await mute_user_with_reason(멤버, inter.guild, 사유, end_time, inter.author)
             await add_mute_log(멤버, inter.guild, 사유, end_time, inter.author, count_mute=False)
             response = f"{멤버.mention}님에게 경고를 주고 {format_duration(duration)} 동안 재갈을 물렸습니다. 사유: {사유}\n현재 경고 횟수: {warning_count}, 재갈 횟수: {mute_count}"
+            # 경고 누적 규칙이 재갈이 아닌 처벌(추방 등)이면 그대로 적용한다
+            for message in await apply_escalation(actions, 멤버, inter.guild, inter.author):
+                response += f"\n{message}"
 
-        await inter.followup.send(response)
-
-    except Exception as e:
-        await inter.followup.send(f"경고재갈 처리 중 오류가 발생했습니다: {str(e)}", ephemeral=True)
+    await inter.followup.send(response)
 
 
 @bot.slash_command(name="재갈풀기", description="사용자의 뮤트를 해제합니다.")
+@moderation_command()
 async def unmute_command(inter: disnake.ApplicationCommandInteraction, 멤버: disnake.Member, 사유: str):
-    await inter.response.defer()
-
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
-        return
-
-    success = await unmute_user(멤버, inter.guild)
-    if success:
-        await mute_logs_collection.insert_one({
-            'user_id': 멤버.id,
-            'username': 멤버.name,
-            'unmuted_at': datetime.now(),
-            'reason': f"뮤트 해제: {사유}",
-            'unmuted_by': {
-                'id': inter.author.id,
-                'name': inter.author.name
-            },
-            'action': 'unmute'
-        })
-        await inter.followup.send(f"{멤버.mention}님의 재갈을 풀었습니다. 사유: {사유}")
-    else:
-        await inter.followup.send(f"{멤버.mention}님은 재갈 상태가 아닙니다.")
+    async with target_locks.hold((inter.guild.id, 멤버.id)):
+        success = await unmute_user(멤버, inter.guild)
+        if success:
+            await add_event('mute', 'unmute', 멤버, inter.guild.id, f"뮤트 해제: {사유}", inter.author)
+            await inter.followup.send(f"{멤버.mention}님의 재갈을 풀었습니다. 사유: {사유}")
+        else:
+            await inter.followup.send(f"{멤버.mention}님은 재갈 상태가 아닙니다.")
 
 
 @bot.slash_command(name="추방", description="사용자를 서버에서 추방합니다.")
+@moderation_command()
 async def kick(inter: disnake.ApplicationCommandInteraction, 멤버: disnake.Member, 사유: str):
-    await inter.response.defer()
+    async with target_locks.hold((inter.guild.id, 멤버.id)):
+        await 멤버.kick(reason=사유)
+        stats = await add_kick_log(멤버, 사유, inter.author)
 
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
-        return
+        response = f"{멤버.mention}님을 서버에서 추방했습니다. 사유: {사유}\n현재 추방 횟수: {stats['kicks']}"
 
-    await 멤버.kick(reason=사유)
-    await add_kick_log(멤버, 사유, inter.author)
-    kick_count = await get_kick_count(멤버.id)
-
-    response = f"{멤버.mention}님을 서버에서 추방했습니다. 사유: {사유}\n현재 추방 횟수: {kick_count}"
-
-    if kick_count % 2 == 0:
-        print(f"{멤버.id} 추방 2회 누적으로 사형 처리")
-        await 멤버.ban(reason="추방 2회 누적")
-        await ban_logs_collection.insert_one({
-            'user_id': 멤버.id,
-            'username': 멤버.name,
-            'guild_id': inter.guild.id,
-            'reason': "킥 2회 누적",
-            'banned_at': datetime.now(),
-            'banned_by': {
-                'id': inter.author.id,
-                'name': inter.author.name
-            }
-        })
-        response += "\n추방 2회 누적으로 사형 처리되었습니다."
+        actions = get_escalation_policy(inter.guild.id).evaluate(stats, 'kicks')
+        for message in await apply_escalation(actions, 멤버, inter.guild, inter.author):
+            response += f"\n{message}"
 
     await inter.followup.send(response)
 
 
 @bot.slash_command(name="사형", description="사용자를 서버에서 차단합니다.")
+@moderation_command(error_message="사형 중 오류가 발생했습니다")
 async def ban(inter: disnake.ApplicationCommandInteraction, 유저: disnake.User, 사유: str = "사유 없음"):
-    await inter.response.defer()
-
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
-        return
-
     try:
-        await inter.guild.ban(유저, reason=사유)
-
-        await ban_logs_collection.insert_one({
-            'user_id': 유저.id,
-            'username': 유저.name,
-            'guild_id': inter.guild.id,
-            'reason': 사유,
-            'banned_at': datetime.now(),
-            'banned_by': {
-                'id': inter.author.id,
-                'name': inter.author.name
-            },
-            'action': 'ban'
-        })
+        async with target_locks.hold((inter.guild.id, 유저.id)):
+            await inter.guild.ban(유저, reason=사유)
+            await add_ban_log(유저, inter.guild, 사유, inter.author)
 
         await inter.followup.send(f"{유저.name}(ID: {유저.id})님을 사형했습니다. 사유: {사유}\n-# 사유 수정을 원한다면 차지철에게 DM")
         await 유저.send(f"당신은 {inter.guild.name}에서 밴 되었습니다. 사유: {사유}")
     except ValueError:
         await inter.followup.send("올바른 사용자 ID를 입력해주세요.", ephemeral=True)
-    except Exception as e:
-        await inter.followup.send(f"사형 중 오류가 발생했습니다: {str(e)}", ephemeral=True)
 
 
 @bot.slash_command(name="사면", description="사용자의 사형을 해제합니다.")
+@moderation_command(error_message="사형 해제 중 오류가 발생했습니다")
 async def unban(inter: disnake.ApplicationCommandInteraction, 아이디: str, 사유: str):
-    await inter.response.defer()
-
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
-        return
-
     try:
         user_id = int(아이디)
-        banned_entry = await inter.guild.fetch_ban(disnake.Object(id=user_id))
+        async with target_locks.hold((inter.guild.id, user_id)):
+            banned_entry = await inter.guild.fetch_ban(disnake.Object(id=user_id))
 
-        if banned_entry is None:
-            await inter.followup.send(f"ID {user_id}인 사용자를 차단 목록에서 찾을 수 없습니다.", ephemeral=True)
-            return
+            if banned_entry is None:
+                await inter.followup.send(f"ID {user_id}인 사용자를 차단 목록에서 찾을 수 없습니다.", ephemeral=True)
+                return
 
-        await inter.guild.unban(banned_entry.user, reason=사유)
-
-        await ban_logs_collection.insert_one({
-            'user_id': user_id,
-            'username': banned_entry.user.name,
-            'guild_id': inter.guild.id,
-            'reason': f"사면: {사유}",
-            'unbanned_at': datetime.now(),
-            'unbanned_by': {
-                'id': inter.author.id,
-                'name': inter.author.name
-            },
-            'action': 'unban'
-        })
+            await inter.guild.unban(banned_entry.user, reason=사유)
+
+            await add_event('ban', 'unban', banned_entry.user, inter.guild.id, f"사면: {사유}", inter.author)
 
         await inter.followup.send(f"{banned_entry.user.name}(ID: {user_id})님을 사면했습니다. 사유: {사유}")
     except disnake.errors.NotFound:
         await inter.followup.send(f"ID {user_id}인 사용자를 차단 목록에서 찾을 수 없습니다.", ephemeral=True)
     except ValueError:
         await inter.followup.send("올바른 사용자 ID를 입력해주세요.", ephemeral=True)
-    except Exception as e:
-        await inter.followup.send(f"사형 해제 중 오류가 발생했습니다: {str(e)}", ephemeral=True)
 
 
 
+@bot.slash_command(name="설정", description="이 서버의 봇 설정을 확인하거나 바꿉니다.")
+@moderation_command(bootstrap=True)
+async def configure(inter: disnake.ApplicationCommandInteraction, 재갈역할: disnake.Role = None,
+                    관리자역할: disnake.Role = None, 로그채널: disnake.TextChannel = None):
+    config = guild_configs.get(inter.guild.id)
+    admin_role_ids = config.admin_role_ids
+
+    changes = {}
+    if inter.guild.id not in guild_configs:
+        # 처음 저장하는 서버는 기본값 중 이 서버에 실제로 있는 역할만 남긴다 (다른 서버의 역할 ID를 물려받지 않게)
+        admin_role_ids = frozenset(role_id for role_id in admin_role_ids if inter.guild.get_role(role_id))
+        changes['admin_role_ids'] = sorted(admin_role_ids)
+        changes['mute_role_id'] = config.mute_role_id if inter.guild.get_role(config.mute_role_id) else None
+    if 재갈역할 is not None:
+        changes['mute_role_id'] = 재갈역할.id
+    if 관리자역할 is not None:
+        # 이미 있는 관리자 역할이면 빼고, 없으면 추가한다
+        changes['admin_role_ids'] = sorted(admin_role_ids ^ {관리자역할.id})
+    if 로그채널 is not None:
+        changes['log_channel_id'] = 로그채널.id
+    if changes:
+        config = await guild_configs.update(inter.guild.id, changes)
+
+    admin_roles = ", ".join(f"<@&{role_id}>" for role_id in sorted(config.admin_role_ids)) or "없음"
+    mute_role = f"<@&{config.mute_role_id}>" if config.mute_role_id else "없음"
+    log_channel = f"<#{config.log_channel_id}>" if config.log_channel_id else "없음"
+    rules = "\n".join(f"• {rule.counter} {rule.every}회마다 {rule.action}" for rule in config.escalation.rules)
+    await inter.followup.send(
+        f"재갈 역할: {mute_role}\n관리자 역할: {admin_roles}\n로그 채널: {log_channel}\n누적 처벌:\n{rules}"
+    )
+
+
 @bot.slash_command(name="로그", description="사용자의 처벌 기록을 확인합니다.")
+@moderation_command()
 async def log(inter: disnake.ApplicationCommandInteraction, 멤버: disnake.User,
               종류: Literal["전체", "경고", "재갈", "추방", "사형"] = "전체"):
-    await inter.response.defer()
-
-    if not any(role.id in ADMIN_ROLE_ID for role in inter.author.roles):
-        await inter.followup.send("이런건 내 주인님만 시킬 수 있다고.", ephemeral=True)
-        return
-
-    warnings = await get_log_entries(warnings_collection, 멤버.id)
-    mutes = await get_log_entries(mute_logs_collection, 멤버.id)
-    kicks = await get_log_entries(kick_logs_collection, 멤버.id)
-    bans = await get_log_entries(ban_logs_collection, 멤버.id)
-
     if 종류 == "전체":
-        embed = create_all_log_embed(멤버, warnings, mutes, kicks, bans)
+        stats = await get_user_stats(inter.guild.id, 멤버.id)
+        recent = await get_recent_events(inter.guild.id, 멤버.id)
+        embed = create_all_log_embed(멤버, recent, stats.get('events', {}))
         await inter.followup.send(embed=embed)
     else:
-        logs = {
-            "경고": warnings,
-            "재갈": mutes,
-            "추방": kicks,
-            "사형": bans
-        }[종류]
+        event_type = EVENT_TYPES[LogType(종류)]
+        logs = await get_log_page(inter.guild.id, 멤버.id, event_type)
 
         if not logs:
             await inter.followup.send(f"{멤버.name}님의 {종류} 기록이 없습니다.")
         else:
-            view = LogPaginator(logs, 종류)
-            embed = view.create_embed()
-            await inter.followup.send(embed=embed, view=view)
-
-
-async def get_log_entries(collection, user_id: int) -> List[Dict]:
-    return await collection.find({'user_id': user_id}).sort('timestamp', -1).to_list(length=None)
-
-
-async def add_warning(member: disnake.Member, guild: disnake.Guild, reason: str, warned_by: disnake.Member):
-    await warnings_collection.insert_one({
-        'user_id': member.id,
-        'username': member.name,
-        'guild_id': guild.id,
-        'reason': reason,
-        'warned_at': datetime.now(),
-        'warned_by': {
-            'id': warned_by.id,
-            'name': warned_by.name
-        },
-        'action': 'add'
-    })
-    return await get_punishment_counts(member.id)
+            stats = await get_user_stats(inter.guild.id, 멤버.id)
+            embed, components = build_log_page(inter.guild.id, 멤버.id, event_type, 0, logs, stats.get('events', {}).get(event_type, 0))
+            await inter.followup.send(embed=embed, components=components)
+
+
+async def get_log_page(guild_id: int, user_id: int, event_type: str = None, after: Tuple = None,
+                       before: Tuple = None, limit: int = LOG_PAGE_SIZE) -> List[Dict]:
+    if log_writer.pending:
+        await log_writer.flush()
+    # (timestamp, _id) 키셋 커서 다음(또는 이전)부터 읽는다
+    return await store.event_page(guild_id, user_id, event_type, after, before, limit)
+
+
+async def migrate_legacy_events(default_guild_id: Optional[int] = None):
+    # 기존 네 컬렉션의 기록을 moderation_events로 옮긴다 (_id를 유지하므로 여러 번 실행해도 안전)
+    # 예전 /재갈풀기 기록처럼 guild_id가 없는 문서는 default_guild_id(--guild)로 채운다
+    missing = 0
+    for collection_name, (event_type, time_field, by_field, default_action) in LEGACY_EVENT_SOURCES.items():
+        moved = 0
+        async for doc in db[collection_name].find():
+            action = doc.get('action', default_action)
+            event = dict(doc)
+            if event.get('guild_id') is None:
+                event['guild_id'] = default_guild_id
+                missing += 1
+            event['type'] = event_type
+            event['action'] = action
+            event['timestamp'] = doc.get('timestamp') or doc.get(time_field) or doc.get('unmuted_at') or doc.get('unbanned_at')
+            event['by'] = doc.get(by_field) or doc.get('unmuted_by') or doc.get('unbanned_by')
+            await store.insert_events([event])
+            moved += 1
+        print(f"{collection_name}: {moved}건 이전 완료")
+    if default_guild_id is not None:
+        # 이전 실행에서 guild_id 없이 들어간 기록도 채운다 (같은 _id는 다시 넣지 않으므로)
+        result = await db['moderation_events'].update_many({'guild_id': None}, {'$set': {'guild_id': default_guild_id}})
+        print(f"guild_id가 없던 기록을 {default_guild_id} 길드로 채웠습니다: 이번에 {missing}건, 이전 실행분 {result.modified_count}건")
+    elif missing:
+        print(f"guild_id가 없는 기록 {missing}건은 /로그와 카운터에 나오지 않습니다. --guild <길드 ID>로 다시 실행하세요.")
+    await rebuild_user_stats()
+
+
+async def add_warning(member: disnake.Member, guild: disnake.Guild, reason: str, warned_by: disnake.Member) -> Dict:
+    return await add_event('warning', 'add', member, guild.id, reason, warned_by,
+                           inc={'warnings': 1, 'warnings_added': 1})
+
+
+async def get_user_stats(guild_id: int, user_id: int) -> Dict:
+    stats = summary_cache.get((guild_id, user_id), 'stats')
+    if stats is not None:
+        return stats
+    stats = await store.get_stats(guild_id, user_id)
+    if stats is None:
+        stats = await rebuild_user_stats(guild_id, user_id)
+    summary_cache.put((guild_id, user_id), 'stats', stats)
+    return stats
+
+
+async def get_recent_events(guild_id: int, user_id: int) -> Dict[str, List[Dict]]:
+    recent = summary_cache.get((guild_id, user_id), 'recent')
+    if recent is not None:
+        return recent
+    if log_writer.pending:
+        await log_writer.flush()
+    recent = await store.recent_events(guild_id, user_id, RECENT_EVENTS_PER_TYPE)
+    summary_cache.put((guild_id, user_id), 'recent', recent)
+    return recent
+
+
+async def bump_user_stats(guild_id: int, user_id: int, inc: Dict[str, int], condition: Dict = None) -> Dict:
+    # 첫 처벌이면 0으로 만든 카운터에 바로 올린다 (명령어가 저널 flush와 전체 재계산을 기다리지 않게)
+    stats = await store.bump_stats(guild_id, user_id, inc, condition, None if condition else EMPTY_COUNTERS)
+    if stats is None:
+        # 조건에 맞지 않으면 원본 로그에서 다시 계산한다 (방금 넣은 로그 포함)
+        stats = await rebuild_user_stats(guild_id, user_id)
+    summary_cache.write((guild_id, user_id), stats)
+    return stats
+
+
+def _empty_stats(guild_id: int, user_id: int) -> Dict:
+    return {'guild_id': guild_id, 'user_id': user_id, 'warnings': 0, 'warnings_added': 0,
+            'mutes': 0, 'kicks': 0, 'bans': 0, 'events': {event_type: 0 for event_type in EVENT_TYPES.values()}}
+
+
+# bump_stats가 카운터를 새로 만들 때 쓰는 초기값 (점 경로)
+EMPTY_COUNTERS = {
+    **{counter: 0 for counter in ('warnings', 'warnings_added', 'mutes', 'kicks', 'bans')},
+    **{f'events.{event_type}': 0 for event_type in EVENT_TYPES.values()},
+}
+
+
+async def rebuild_user_stats(guild_id: int = None, user_id: int = None):
+    # 아직 저널에만 있는 기록도 계산에 포함되도록 먼저 내보낸다
+    await log_writer.flush()
+    results = {}
+
+    def stats_for(doc):
+        key = (doc['guild_id'], doc['user_id'])
+        if key not in results:
+            results[key] = _empty_stats(*key)
+        return results[key]
+
+    # 경고는 추가/삭제 순서대로 다시 계산해야 하므로 시간순으로 한 번에 훑는다
+    async for event in store.iter_events(guild_id, user_id):
+        stats = stats_for(event)
+        event_type, action = event['type'], event.get('action')
+        stats['events'][event_type] = stats['events'].get(event_type, 0) + 1
+        if event_type == 'warning':
+            if action == 'add':
+                stats['warnings'] += 1
+                stats['warnings_added'] += 1
+            elif action == 'remove':
+                stats['warnings'] = max(0, stats['warnings'] - 1)
+        elif event_type == 'mute' and action == 'mute':
+            stats['mutes'] += 1
+        elif event_type == 'kick':
+            stats['kicks'] += 1
+        elif event_type == 'ban' and action != 'unban':
+            stats['bans'] += 1
+
+    if guild_id is not None and user_id is not None:
+        results.setdefault((guild_id, user_id), _empty_stats(guild_id, user_id))
+
+    for stats in results.values():
+        await store.replace_stats(stats)
+
+    if guild_id is not None and user_id is not None:
+        summary_cache.write((guild_id, user_id), results[(guild_id, user_id)])
+        return results[(guild_id, user_id)]
+    summary_cache.invalidate()
+    print(f"처벌 카운터 재계산 완료: {len(results)}명")
+    return results
 
 
-async def get_warning_count(user_id: int) -> int:
-    warnings = await warnings_collection.find({'user_id': user_id}).sort('warned_at', 1).to_list(length=None)
-    count = 0
-    for warning in warnings:
-        if warning.get('action', 'add') == 'add':
-            count += 1
-        elif warning.get('action') == 'remove':
-            count = max(0, count - 1)  # 경고 수가 음수가 되지 않도록 합니다
-    return count
+async def get_warning_count(guild_id: int, user_id: int) -> int:
+    return (await get_user_stats(guild_id, user_id))['warnings']
 
 
-async def get_mute_count(user_id: int) -> int:
-    mutes = await mute_logs_collection.find({'user_id': user_id}).to_list(length=None)
-    return sum(1 for m in mutes if m.get('action') == 'mute')
+async def get_mute_count(guild_id: int, user_id: int) -> int:
+    return (await get_user_stats(guild_id, user_id))['mutes']
 
 
-async def get_kick_count(user_id: int) -> int:
-    return await kick_logs_collection.count_documents({'user_id': user_id})
+async def get_kick_count(guild_id: int, user_id: int) -> int:
+    return (await get_user_stats(guild_id, user_id))['kicks']
 
 
-async def get_punishment_counts(user_id: int) -> Tuple[int, int]:
-    warnings = await warnings_collection.count_documents({'user_id': user_id, 'action': 'add'})
-    mutes = await mute_logs_collection.count_documents({'user_id': user_id, 'action': 'mute'})
-    return warnings, mutes
+async def get_punishment_counts(guild_id: int, user_id: int) -> Tuple[int, int]:
+    stats = await get_user_stats(guild_id, user_id)
+    return stats['warnings_added'], stats['mutes']
 
 
 async def mute_user_with_reason(member: disnake.Member, guild: disnake.Guild, reason: str, end_time: datetime,
@@ -620,11 +2234,6 @@ async def mute_user_with_reason(member: disnake.Member, guild: disnake.Guild, re
     await mute_manager.mute_user(member, guild, reason, end_time, muted_by)
 
 
-async def schedule_unmute(member: disnake.Member, guild: disnake.Guild, end_time: datetime):
-    await asyncio.sleep((end_time - datetime.now()).total_seconds())
-    await unmute_user(member, guild)
-
-
 async def unmute_user(member: disnake.Member, guild: disnake.Guild) -> bool:
     return await mute_manager.unmute_user(member, guild)
 
@@ -669,17 +2278,21 @@ def format_duration(duration: timedelta) -> str:
 
 @bot.event
 async def on_slash_command_error(inter: disnake.ApplicationCommandInteraction, error: Exception):
+    # 미들웨어 밖(옵션 변환 등)에서 난 오류만 여기로 온다
     if isinstance(error, commands.errors.CommandInvokeError):
         error = error.original
 
-    error_message = f"명령어 실행 중 오류가 발생했습니다: {str(error)}"
-    print(error_message)  # 콘솔에 오류 출력
-
-    if not inter.response.is_done():
-        await inter.response.send_message(error_message, ephemeral=True)
-    else:
-        await inter.followup.send(error_message, ephemeral=True)
+    log_command(inter, classify_error(error), 0.0, error)
+    await send_error(inter, f"명령어 실행 중 오류가 발생했습니다: {str(error)}")
 
 
 if __name__ == "__main__":
-    bot.run(BOT_TOKEN)
+    if "--check-indexes" in sys.argv:
+        asyncio.run(check_indexes())
+    elif "--rebuild-stats" in sys.argv:
+        asyncio.run(rebuild_user_stats())
+    elif "--migrate-events" in sys.argv:
+        guild_arg = sys.argv[sys.argv.index("--guild") + 1] if "--guild" in sys.argv else None
+        asyncio.run(migrate_legacy_events(int(guild_arg) if guild_arg else None))
+    else:
+        bot.run(BOT_TOKEN)
@@ -0,0 +1,696 @@
+"""
+복순이 제작소 - 저장소
+
+처벌 기록, 카운터, 역할 스냅샷, 재갈 예약, 길드 설정을 읽고 쓰는 인터페이스와 구현
+- MotorStorage: MongoDB (기본)
+- MemoryStorage: 프로세스 메모리 (테스트/벤치마크용, 재시작하면 사라짐)
+- SqliteStorage: 로컬 sqlite 파일 (Mongo 없이 돌리는 작은 서버용)
+"""
+
+import abc
+import asyncio
+import copy
+import sqlite3
+import threading
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+SNAPSHOT_STATES = ('pending', 'restoring')
+
+
+def _get_path(doc: Dict, path: str):
+    for part in path.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def _inc_path(doc: Dict, path: str, amount: int):
+    *parents, last = path.split('.')
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = doc.get(last, 0) + amount
+
+
+def _set_path(doc: Dict, path: str, value):
+    *parents, last = path.split('.')
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _matches(doc: Dict, condition: Optional[Dict]) -> bool:
+    # bump_stats 조건에 쓰는 비교 연산만 지원한다
+    operators = {
+        '$gt': lambda a, b: a is not None and a > b,
+        '$gte': lambda a, b: a is not None and a >= b,
+        '$lt': lambda a, b: a is not None and a < b,
+        '$lte': lambda a, b: a is not None and a <= b,
+        '$ne': lambda a, b: a != b,
+    }
+    for path, expected in (condition or {}).items():
+        value = _get_path(doc, path)
+        if isinstance(expected, dict):
+            if not all(operators[op](value, arg) for op, arg in expected.items()):
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def _new_stats(guild_id: int, user_id: int, defaults: Dict[str, int]) -> Dict:
+    stats = {'_id': ObjectId(), 'guild_id': guild_id, 'user_id': user_id}
+    for path, value in defaults.items():
+        _set_path(stats, path, value)
+    return stats
+
+
+def _page_key(doc: Dict) -> Tuple[datetime, ObjectId]:
+    return doc['timestamp'], doc['_id']
+
+
+def _truncate_ms(value):
+    # BSON 날짜는 밀리초까지만 저장되므로 Mongo/sqlite와 같은 값으로 맞춘다
+    if isinstance(value, datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+class Storage(abc.ABC):
+    # 처벌 기록
+    @abc.abstractmethod
+    async def insert_events(self, docs: List[Dict]):
+        # 같은 _id가 이미 있으면 건너뛴다 (저널 재실행)
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def event_page(self, guild_id: int, user_id: int, event_type: Optional[str], after: Optional[Tuple],
+                         before: Optional[Tuple], limit: int) -> List[Dict]:
+        # (timestamp, _id) 내림차순 키셋 페이지
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def recent_events(self, guild_id: int, user_id: int, per_type: int) -> Dict[str, List[Dict]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_events(self, guild_id: Optional[int] = None, user_id: Optional[int] = None) -> AsyncIterator[Dict]:
+        # guild_id가 있는 기록을 (guild_id, user_id, timestamp) 순으로
+        raise NotImplementedError
+
+    # 카운터
+    @abc.abstractmethod
+    async def get_stats(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def bump_stats(self, guild_id: int, user_id: int, inc: Dict[str, int],
+                         condition: Optional[Dict] = None, defaults: Optional[Dict[str, int]] = None) -> Optional[Dict]:
+        # 카운터가 없거나 조건에 맞지 않으면 None
+        # defaults(점 경로 -> 초기값)가 있으면 카운터가 없을 때 만들어서 올린다 (condition과 같이 쓰지 않는다)
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def replace_stats(self, stats: Dict):
+        raise NotImplementedError
+
+    # 역할 스냅샷
+    @abc.abstractmethod
+    async def save_snapshot(self, guild_id: int, user_id: int, fields: Dict):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def set_snapshot_state(self, snapshot: Dict, state: str):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def claim_snapshot(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        # 상태를 restoring으로 바꾸고 바꾸기 전 문서를 돌려준다 (guild_id가 없는 예전 스냅샷 포함)
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete_snapshot(self, snapshot: Dict):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_unfinished_snapshots(self, guild_ids: Optional[List[int]] = None) -> AsyncIterator[Dict]:
+        raise NotImplementedError
+
+    # 재갈 예약
+    @abc.abstractmethod
+    async def save_mute_task(self, guild_id: int, user_id: int, fields: Dict):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_mute_task(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete_mute_task(self, guild_id: int, user_id: int):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_mute_tasks(self, guild_ids: Optional[List[int]] = None, batch_size: int = 100) -> AsyncIterator[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def expired_mute_tasks(self, cutoff: datetime, guild_ids: Optional[List[int]],
+                                 after: Optional[Tuple], limit: int) -> List[Dict]:
+        # end_time <= cutoff 인 예약을 (end_time, _id) 순으로 after 다음부터
+        raise NotImplementedError
+
+    # 길드 설정
+    @abc.abstractmethod
+    def iter_guild_configs(self, updated_since: Optional[datetime] = None) -> AsyncIterator[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def update_guild_config(self, guild_id: int, changes: Dict) -> Dict:
+        raise NotImplementedError
+
+
+class MotorStorage(Storage):
+    def __init__(self, db):
+        self.db = db
+        self.events = db['moderation_events']
+        self.user_stats = db['user_stats']
+        self.user_roles = db['user_roles']
+        self.mute_tasks = db['mute_tasks']
+        self.guild_config = db['guild_config']
+
+    async def insert_events(self, docs: List[Dict]):
+        try:
+            await self.events.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # 이미 들어간 문서(중복 키)는 무시한다
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+
+    async def event_page(self, guild_id, user_id, event_type, after, before, limit):
+        query = {'guild_id': guild_id, 'user_id': user_id}
+        if event_type is not None:
+            query['type'] = event_type
+        if after is not None:
+            timestamp, last_id = after
+            query['$or'] = [
+                {'timestamp': {'$lt': timestamp}},
+                {'timestamp': timestamp, '_id': {'$lt': last_id}},
+            ]
+        elif before is not None:
+            # 이전 페이지는 반대 방향으로 읽은 뒤 뒤집는다
+            timestamp, first_id = before
+            query['$or'] = [
+                {'timestamp': {'$gt': timestamp}},
+                {'timestamp': timestamp, '_id': {'$gt': first_id}},
+            ]
+            cursor = self.events.find(query).sort([('timestamp', 1), ('_id', 1)]).limit(limit)
+            return list(reversed(await cursor.to_list(length=limit)))
+        cursor = self.events.find(query).sort([('timestamp', -1), ('_id', -1)]).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def recent_events(self, guild_id, user_id, per_type):
+        # 종류별 최근 기록을 한 번의 집계로 가져온다
+        pipeline = [
+            {'$match': {'guild_id': guild_id, 'user_id': user_id}},
+            {'$sort': {'timestamp': -1, '_id': -1}},
+            {'$group': {'_id': '$type', 'events': {'$push': '$$ROOT'}}},
+            {'$project': {'events': {'$slice': ['$events', per_type]}}},
+        ]
+        return {row['_id']: row['events'] async for row in self.events.aggregate(pipeline)}
+
+    async def iter_events(self, guild_id=None, user_id=None):
+        match = {'guild_id': {'$ne': None}}
+        if guild_id is not None:
+            match['guild_id'] = guild_id
+        if user_id is not None:
+            match['user_id'] = user_id
+        cursor = self.events.find(
+            match, {'_id': 0, 'guild_id': 1, 'user_id': 1, 'type': 1, 'action': 1}
+        ).sort([('guild_id', 1), ('user_id', 1), ('timestamp', 1)])
+        async for event in cursor:
+            yield event
+
+    async def get_stats(self, guild_id, user_id):
+        return await self.user_stats.find_one({'guild_id': guild_id, 'user_id': user_id})
+
+    async def bump_stats(self, guild_id, user_id, inc, condition=None, defaults=None):
+        query = {'guild_id': guild_id, 'user_id': user_id}
+        if condition:
+            query.update(condition)
+        update = {'$inc': inc}
+        if defaults:
+            # $inc와 같은 경로를 $setOnInsert에 함께 쓰면 충돌하므로 뺀다
+            update['$setOnInsert'] = {path: value for path, value in defaults.items() if path not in inc}
+        return await self.user_stats.find_one_and_update(query, update, upsert=bool(defaults),
+                                                         return_document=ReturnDocument.AFTER)
+
+    async def replace_stats(self, stats):
+        await self.user_stats.replace_one({'guild_id': stats['guild_id'], 'user_id': stats['user_id']}, stats, upsert=True)
+
+    async def save_snapshot(self, guild_id, user_id, fields):
+        await self.user_roles.update_one({'guild_id': guild_id, 'user_id': user_id}, {'$set': fields}, upsert=True)
+
+    async def set_snapshot_state(self, snapshot, state):
+        await self.user_roles.update_one({'_id': snapshot['_id']}, {'$set': {'state': state}})
+
+    async def claim_snapshot(self, guild_id, user_id):
+        return await self.user_roles.find_one_and_update(
+            {'user_id': user_id, 'guild_id': {'$in': [guild_id, None]}}, {'$set': {'state': 'restoring'}}
+        )
+
+    async def delete_snapshot(self, snapshot):
+        await self.user_roles.delete_one({'_id': snapshot['_id']})
+
+    async def iter_unfinished_snapshots(self, guild_ids=None):
+        query = {'state': {'$in': list(SNAPSHOT_STATES)}}
+        if guild_ids is not None:
+            query['guild_id'] = {'$in': guild_ids}
+        async for snapshot in self.user_roles.find(query):
+            yield snapshot
+
+    async def save_mute_task(self, guild_id, user_id, fields):
+        await self.mute_tasks.update_one({'guild_id': guild_id, 'user_id': user_id}, {'$set': fields}, upsert=True)
+
+    async def get_mute_task(self, guild_id, user_id):
+        return await self.mute_tasks.find_one({'guild_id': guild_id, 'user_id': user_id})
+
+    async def delete_mute_task(self, guild_id, user_id):
+        await self.mute_tasks.delete_one({'guild_id': guild_id, 'user_id': user_id})
+
+    async def iter_mute_tasks(self, guild_ids=None, batch_size=100):
+        query = {} if guild_ids is None else {'guild_id': {'$in': guild_ids}}
+        cursor = self.mute_tasks.find(query, {'guild_id': 1, 'user_id': 1, 'end_time': 1}, batch_size=batch_size)
+        async for mute in cursor:
+            yield mute
+
+    async def expired_mute_tasks(self, cutoff, guild_ids, after, limit):
+        query = {'end_time': {'$lte': cutoff}}
+        if guild_ids is not None:
+            query['guild_id'] = {'$in': guild_ids}
+        if after is not None:
+            query = {'$and': [query, {'$or': [
+                {'end_time': {'$gt': after[0]}}, {'end_time': after[0], '_id': {'$gt': after[1]}}
+            ]}]}
+        cursor = self.mute_tasks.find(query, {'guild_id': 1, 'user_id': 1, 'end_time': 1})
+        return await cursor.sort([('end_time', 1), ('_id', 1)]).limit(limit).to_list(None)
+
+    async def iter_guild_configs(self, updated_since=None):
+        query = {'updated_at': {'$gt': updated_since}} if updated_since else {}
+        async for doc in self.guild_config.find(query):
+            yield doc
+
+    async def update_guild_config(self, guild_id, changes):
+        return await self.guild_config.find_one_and_update(
+            {'guild_id': guild_id},
+            {'$set': {**changes, 'updated_at': datetime.now()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+
+class MemoryStorage(Storage):
+    # 문서를 복사해서 주고받아 호출한 쪽이 고쳐도 저장된 값이 바뀌지 않게 한다
+    def __init__(self):
+        self.events: Dict[ObjectId, Dict] = {}
+        self.events_by_user: Dict[Tuple[Optional[int], int], List[Dict]] = {}
+        self.user_stats: Dict[Tuple[int, int], Dict] = {}
+        self.user_roles: Dict[Tuple[Optional[int], int], Dict] = {}
+        self.mute_tasks: Dict[Tuple[int, int], Dict] = {}
+        self.guild_config: Dict[int, Dict] = {}
+
+    async def insert_events(self, docs):
+        for doc in docs:
+            if doc['_id'] in self.events:
+                continue
+            doc = copy.deepcopy(doc)
+            doc['timestamp'] = _truncate_ms(doc.get('timestamp'))
+            self.events[doc['_id']] = doc
+            self.events_by_user.setdefault((doc.get('guild_id'), doc['user_id']), []).append(doc)
+
+    async def event_page(self, guild_id, user_id, event_type, after, before, limit):
+        events = [doc for doc in self.events_by_user.get((guild_id, user_id), [])
+                  if event_type is None or doc['type'] == event_type]
+        if before is not None:
+            events = sorted((doc for doc in events if _page_key(doc) > before), key=_page_key)[:limit]
+            return copy.deepcopy(events[::-1])
+        if after is not None:
+            events = [doc for doc in events if _page_key(doc) < after]
+        return copy.deepcopy(sorted(events, key=_page_key, reverse=True)[:limit])
+
+    async def recent_events(self, guild_id, user_id, per_type):
+        recent: Dict[str, List[Dict]] = {}
+        for doc in sorted(self.events_by_user.get((guild_id, user_id), []), key=_page_key, reverse=True):
+            events = recent.setdefault(doc['type'], [])
+            if len(events) < per_type:
+                events.append(copy.deepcopy(doc))
+        return recent
+
+    async def iter_events(self, guild_id=None, user_id=None):
+        events = [doc for doc in self.events.values() if doc.get('guild_id') is not None
+                  and (guild_id is None or doc['guild_id'] == guild_id)
+                  and (user_id is None or doc['user_id'] == user_id)]
+        for doc in sorted(events, key=lambda d: (d['guild_id'], d['user_id'], d['timestamp'])):
+            yield {key: doc.get(key) for key in ('guild_id', 'user_id', 'type', 'action')}
+
+    async def get_stats(self, guild_id, user_id):
+        return copy.deepcopy(self.user_stats.get((guild_id, user_id)))
+
+    async def bump_stats(self, guild_id, user_id, inc, condition=None, defaults=None):
+        stats = self.user_stats.get((guild_id, user_id))
+        if stats is None and defaults:
+            stats = self.user_stats[(guild_id, user_id)] = _new_stats(guild_id, user_id, defaults)
+        if stats is None or not _matches(stats, condition):
+            return None
+        for path, amount in inc.items():
+            _inc_path(stats, path, amount)
+        return copy.deepcopy(stats)
+
+    async def replace_stats(self, stats):
+        stats = copy.deepcopy(stats)
+        stats.setdefault('_id', ObjectId())
+        self.user_stats[(stats['guild_id'], stats['user_id'])] = stats
+
+    async def save_snapshot(self, guild_id, user_id, fields):
+        snapshot = self.user_roles.setdefault((guild_id, user_id),
+                                              {'_id': ObjectId(), 'guild_id': guild_id, 'user_id': user_id})
+        snapshot.update(copy.deepcopy(fields))
+
+    async def set_snapshot_state(self, snapshot, state):
+        stored = self.user_roles.get((snapshot.get('guild_id'), snapshot['user_id']))
+        if stored is not None and stored['_id'] == snapshot['_id']:
+            stored['state'] = state
+
+    async def claim_snapshot(self, guild_id, user_id):
+        for key in ((guild_id, user_id), (None, user_id)):
+            snapshot = self.user_roles.get(key)
+            if snapshot is not None:
+                before = copy.deepcopy(snapshot)
+                snapshot['state'] = 'restoring'
+                return before
+        return None
+
+    async def delete_snapshot(self, snapshot):
+        key = (snapshot.get('guild_id'), snapshot['user_id'])
+        stored = self.user_roles.get(key)
+        if stored is not None and stored['_id'] == snapshot['_id']:
+            del self.user_roles[key]
+
+    async def iter_unfinished_snapshots(self, guild_ids=None):
+        for snapshot in list(self.user_roles.values()):
+            if snapshot.get('state') in SNAPSHOT_STATES and (guild_ids is None or snapshot.get('guild_id') in guild_ids):
+                yield copy.deepcopy(snapshot)
+
+    async def save_mute_task(self, guild_id, user_id, fields):
+        task = self.mute_tasks.setdefault((guild_id, user_id),
+                                          {'_id': ObjectId(), 'guild_id': guild_id, 'user_id': user_id})
+        task.update(copy.deepcopy(fields))
+        task['end_time'] = _truncate_ms(task.get('end_time'))
+
+    async def get_mute_task(self, guild_id, user_id):
+        return copy.deepcopy(self.mute_tasks.get((guild_id, user_id)))
+
+    async def delete_mute_task(self, guild_id, user_id):
+        self.mute_tasks.pop((guild_id, user_id), None)
+
+    async def iter_mute_tasks(self, guild_ids=None, batch_size=100):
+        for task in list(self.mute_tasks.values()):
+            if guild_ids is None or task['guild_id'] in guild_ids:
+                yield copy.deepcopy(task)
+
+    async def expired_mute_tasks(self, cutoff, guild_ids, after, limit):
+        tasks = [task for task in self.mute_tasks.values()
+                 if task['end_time'] <= cutoff and (guild_ids is None or task['guild_id'] in guild_ids)
+                 and (after is None or (task['end_time'], task['_id']) > after)]
+        tasks.sort(key=lambda task: (task['end_time'], task['_id']))
+        return copy.deepcopy(tasks[:limit])
+
+    async def iter_guild_configs(self, updated_since=None):
+        for doc in list(self.guild_config.values()):
+            if updated_since is None or (doc.get('updated_at') and doc['updated_at'] > updated_since):
+                yield copy.deepcopy(doc)
+
+    async def update_guild_config(self, guild_id, changes):
+        doc = self.guild_config.setdefault(guild_id, {'_id': ObjectId(), 'guild_id': guild_id})
+        doc.update(copy.deepcopy(changes))
+        doc['updated_at'] = _truncate_ms(datetime.now())
+        return copy.deepcopy(doc)
+
+
+def _ms(value: datetime) -> int:
+    # Mongo처럼 밀리초 단위로 비교한다
+    return int((value - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+class SqliteStorage(Storage):
+    # 문서는 BSON으로 통째로 저장하고 조회/정렬에 쓰는 필드만 컬럼으로 뺀다
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS moderation_events (
+        id TEXT PRIMARY KEY, guild_id INTEGER, user_id INTEGER, type TEXT, ts INTEGER, doc BLOB);
+    DROP INDEX IF EXISTS events_user_type_ts;
+    DROP INDEX IF EXISTS events_user_ts;
+    DROP INDEX IF EXISTS events_guild_user_ts;
+    CREATE INDEX IF NOT EXISTS events_guild_user_type_ts ON moderation_events (guild_id, user_id, type, ts, id);
+    CREATE INDEX IF NOT EXISTS events_guild_user_ts_id ON moderation_events (guild_id, user_id, ts, id);
+    CREATE TABLE IF NOT EXISTS user_stats (
+        guild_id INTEGER, user_id INTEGER, doc BLOB, PRIMARY KEY (guild_id, user_id));
+    CREATE TABLE IF NOT EXISTS user_roles (
+        id TEXT PRIMARY KEY, guild_id INTEGER, user_id INTEGER, state TEXT, doc BLOB);
+    CREATE UNIQUE INDEX IF NOT EXISTS user_roles_guild_user ON user_roles (guild_id, user_id);
+    CREATE INDEX IF NOT EXISTS user_roles_state ON user_roles (state);
+    CREATE TABLE IF NOT EXISTS mute_tasks (
+        id TEXT PRIMARY KEY, guild_id INTEGER, user_id INTEGER, end_time INTEGER, doc BLOB);
+    CREATE UNIQUE INDEX IF NOT EXISTS mute_tasks_guild_user ON mute_tasks (guild_id, user_id);
+    CREATE INDEX IF NOT EXISTS mute_tasks_end_time ON mute_tasks (end_time, id);
+    CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id INTEGER PRIMARY KEY, updated_at INTEGER, doc BLOB);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    async def _run(self, func, *args):
+        # sqlite 호출은 짧지만 디스크를 기다릴 수 있어서 스레드에서 한 번에 하나씩 실행한다
+        return await asyncio.to_thread(self._locked, func, *args)
+
+    def _locked(self, func, *args):
+        with self._lock:
+            return func(*args)
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        return [bson.decode(row[0]) for row in self._conn.execute(sql, params)]
+
+    def _query_one(self, sql: str, params=()) -> Optional[Dict]:
+        row = self._conn.execute(sql, params).fetchone()
+        return bson.decode(row[0]) if row else None
+
+    @staticmethod
+    def _in(column: str, values: Optional[List[int]]) -> Tuple[str, List]:
+        if values is None:
+            return "", []
+        if not values:
+            return " AND 0", []
+        return f" AND {column} IN ({','.join('?' * len(values))})", list(values)
+
+    async def insert_events(self, docs):
+        rows = [(str(doc['_id']), doc.get('guild_id'), doc['user_id'], doc['type'], _ms(doc['timestamp']),
+                 bson.encode(doc)) for doc in docs]
+
+        def insert():
+            with self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO moderation_events VALUES (?, ?, ?, ?, ?, ?)", rows)
+        await self._run(insert)
+
+    async def event_page(self, guild_id, user_id, event_type, after, before, limit):
+        where, params = "guild_id = ? AND user_id = ?", [guild_id, user_id]
+        if event_type is not None:
+            where += " AND type = ?"
+            params.append(event_type)
+        if before is not None:
+            where += " AND (ts > ? OR (ts = ? AND id > ?))"
+            params += [_ms(before[0]), _ms(before[0]), str(before[1])]
+            sql = f"SELECT doc FROM moderation_events WHERE {where} ORDER BY ts, id LIMIT ?"
+            return list(reversed(await self._run(self._query, sql, params + [limit])))
+        if after is not None:
+            where += " AND (ts < ? OR (ts = ? AND id < ?))"
+            params += [_ms(after[0]), _ms(after[0]), str(after[1])]
+        sql = f"SELECT doc FROM moderation_events WHERE {where} ORDER BY ts DESC, id DESC LIMIT ?"
+        return await self._run(self._query, sql, params + [limit])
+
+    async def recent_events(self, guild_id, user_id, per_type):
+        sql = ("SELECT doc FROM (SELECT doc, ROW_NUMBER() OVER (PARTITION BY type ORDER BY ts DESC, id DESC) AS n "
+               "FROM moderation_events WHERE guild_id = ? AND user_id = ?) WHERE n <= ?")
+        recent: Dict[str, List[Dict]] = {}
+        for doc in await self._run(self._query, sql, (guild_id, user_id, per_type)):
+            recent.setdefault(doc['type'], []).append(doc)
+        return recent
+
+    async def iter_events(self, guild_id=None, user_id=None):
+        where, params = "guild_id IS NOT NULL", []
+        if guild_id is not None:
+            where += " AND guild_id = ?"
+            params.append(guild_id)
+        if user_id is not None:
+            where += " AND user_id = ?"
+            params.append(user_id)
+        sql = f"SELECT doc FROM moderation_events WHERE {where} ORDER BY guild_id, user_id, ts"
+        for doc in await self._run(self._query, sql, params):
+            yield {key: doc.get(key) for key in ('guild_id', 'user_id', 'type', 'action')}
+
+    async def get_stats(self, guild_id, user_id):
+        return await self._run(self._query_one, "SELECT doc FROM user_stats WHERE guild_id = ? AND user_id = ?",
+                               (guild_id, user_id))
+
+    async def bump_stats(self, guild_id, user_id, inc, condition=None, defaults=None):
+        def bump():
+            with self._conn:
+                stats = self._query_one("SELECT doc FROM user_stats WHERE guild_id = ? AND user_id = ?",
+                                        (guild_id, user_id))
+                if stats is None and defaults:
+                    stats = _new_stats(guild_id, user_id, defaults)
+                if stats is None or not _matches(stats, condition):
+                    return None
+                for path, amount in inc.items():
+                    _inc_path(stats, path, amount)
+                self._conn.execute("INSERT OR REPLACE INTO user_stats VALUES (?, ?, ?)",
+                                   (guild_id, user_id, bson.encode(stats)))
+                return stats
+        return await self._run(bump)
+
+    async def replace_stats(self, stats):
+        stats = dict(stats)
+        stats.setdefault('_id', ObjectId())
+
+        def replace():
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO user_stats VALUES (?, ?, ?)",
+                                   (stats['guild_id'], stats['user_id'], bson.encode(stats)))
+        await self._run(replace)
+
+    def _upsert_keyed(self, table: str, guild_id: int, user_id: int, fields: Dict, extra_columns: Dict):
+        # (guild_id, user_id) 문서에 fields를 덮어쓴다 ($set + upsert)
+        with self._conn:
+            doc = self._query_one(f"SELECT doc FROM {table} WHERE guild_id IS ? AND user_id = ?", (guild_id, user_id))
+            if doc is None:
+                doc = {'_id': ObjectId(), 'guild_id': guild_id, 'user_id': user_id}
+            doc.update(fields)
+            columns = {'id': str(doc['_id']), 'guild_id': guild_id, 'user_id': user_id,
+                       **{column: getter(doc) for column, getter in extra_columns.items()}, 'doc': bson.encode(doc)}
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                list(columns.values())
+            )
+
+    async def save_snapshot(self, guild_id, user_id, fields):
+        await self._run(self._upsert_keyed, 'user_roles', guild_id, user_id, fields, {'state': lambda d: d.get('state')})
+
+    async def set_snapshot_state(self, snapshot, state):
+        await self._run(self._set_snapshot_state, str(snapshot['_id']), state)
+
+    def _set_snapshot_state(self, snapshot_id: str, state: str) -> Optional[Dict]:
+        with self._conn:
+            doc = self._query_one("SELECT doc FROM user_roles WHERE id = ?", (snapshot_id,))
+            if doc is None:
+                return None
+            before = dict(doc)
+            doc['state'] = state
+            self._conn.execute("UPDATE user_roles SET state = ?, doc = ? WHERE id = ?",
+                               (state, bson.encode(doc), snapshot_id))
+            return before
+
+    async def claim_snapshot(self, guild_id, user_id):
+        def claim():
+            with self._conn:
+                row = self._conn.execute(
+                    "SELECT id FROM user_roles WHERE user_id = ? AND (guild_id = ? OR guild_id IS NULL) LIMIT 1",
+                    (user_id, guild_id)
+                ).fetchone()
+                return self._set_snapshot_state(row[0], 'restoring') if row else None
+        return await self._run(claim)
+
+    async def delete_snapshot(self, snapshot):
+        await self._run(self._delete, "DELETE FROM user_roles WHERE id = ?", (str(snapshot['_id']),))
+
+    def _delete(self, sql: str, params):
+        with self._conn:
+            self._conn.execute(sql, params)
+
+    async def iter_unfinished_snapshots(self, guild_ids=None):
+        guild_filter, params = self._in("guild_id", guild_ids)
+        sql = f"SELECT doc FROM user_roles WHERE state IN (?, ?){guild_filter}"
+        for snapshot in await self._run(self._query, sql, [*SNAPSHOT_STATES, *params]):
+            yield snapshot
+
+    async def save_mute_task(self, guild_id, user_id, fields):
+        await self._run(self._upsert_keyed, 'mute_tasks', guild_id, user_id, fields,
+                        {'end_time': lambda d: _ms(d['end_time'])})
+
+    async def get_mute_task(self, guild_id, user_id):
+        return await self._run(self._query_one, "SELECT doc FROM mute_tasks WHERE guild_id = ? AND user_id = ?",
+                               (guild_id, user_id))
+
+    async def delete_mute_task(self, guild_id, user_id):
+        await self._run(self._delete, "DELETE FROM mute_tasks WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+
+    async def iter_mute_tasks(self, guild_ids=None, batch_size=100):
+        guild_filter, params = self._in("guild_id", guild_ids)
+        last = ""
+        while True:
+            # 한 번에 다 읽지 않고 id 순으로 나눠 읽는다
+            batch = await self._run(self._query, f"SELECT doc FROM mute_tasks WHERE id > ?{guild_filter} ORDER BY id LIMIT ?",
+                                    [last, *params, batch_size])
+            for task in batch:
+                yield task
+            if len(batch) < batch_size:
+                return
+            last = str(batch[-1]['_id'])
+
+    async def expired_mute_tasks(self, cutoff, guild_ids, after, limit):
+        guild_filter, params = self._in("guild_id", guild_ids)
+        where, where_params = "end_time <= ?", [_ms(cutoff)]
+        if after is not None:
+            where += " AND (end_time > ? OR (end_time = ? AND id > ?))"
+            where_params += [_ms(after[0]), _ms(after[0]), str(after[1])]
+        sql = f"SELECT doc FROM mute_tasks WHERE {where}{guild_filter} ORDER BY end_time, id LIMIT ?"
+        return await self._run(self._query, sql, [*where_params, *params, limit])
+
+    async def iter_guild_configs(self, updated_since=None):
+        if updated_since is None:
+            docs = await self._run(self._query, "SELECT doc FROM guild_config")
+        else:
+            docs = await self._run(self._query, "SELECT doc FROM guild_config WHERE updated_at > ?", (_ms(updated_since),))
+        for doc in docs:
+            yield doc
+
+    async def update_guild_config(self, guild_id, changes):
+        def update():
+            with self._conn:
+                doc = self._query_one("SELECT doc FROM guild_config WHERE guild_id = ?", (guild_id,))
+                if doc is None:
+                    doc = {'_id': ObjectId(), 'guild_id': guild_id}
+                doc.update(changes)
+                doc['updated_at'] = datetime.now()
+                encoded = bson.encode(doc)
+                self._conn.execute("INSERT OR REPLACE INTO guild_config VALUES (?, ?, ?)",
+                                   (guild_id, _ms(doc['updated_at']), encoded))
+                # 저장된 값과 같도록 밀리초로 잘린 문서를 돌려준다
+                return bson.decode(encoded)
+        return await self._run(update)
+
+
+def create_storage(backend: str, db=None, path: str = None) -> Storage:
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SqliteStorage(path)
+    return MotorStorage(db)
@@ -0,0 +1,17 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# 저장소 모듈은 패키지가 아니라 저장소 최상위에 있다
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def main():
+    # main은 불러올 때 봇과 저장소를 만들므로 메모리 저장소로 한 번만 불러온다
+    os.environ["STORAGE_BACKEND"] = "memory"
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    import main as loaded
+    return loaded
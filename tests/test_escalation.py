@@ -0,0 +1,89 @@
+"""
+누적 처벌 정책(EscalationPolicy)과 길드 설정의 규칙 검증
+"""
+
+from datetime import timedelta
+
+import pytest
+
+
+def stats(**counters):
+    base = {'warnings': 0, 'warnings_added': 0, 'mutes': 0, 'kicks': 0, 'bans': 0}
+    base.update(counters)
+    return base
+
+
+def actions(policy, current, counter):
+    return [rule.action for rule in policy.evaluate(current, counter)]
+
+
+@pytest.fixture
+def policy(main):
+    return main.EscalationPolicy(main.DEFAULT_ESCALATION_RULES)
+
+
+def test_no_action_below_threshold(policy):
+    assert actions(policy, stats(warnings_added=2), 'warnings_added') == []
+    assert actions(policy, stats(warnings_added=0), 'warnings_added') == []
+
+
+def test_mute_every_third_warning(policy):
+    assert actions(policy, stats(warnings_added=3), 'warnings_added') == ['mute']
+    assert actions(policy, stats(warnings_added=4), 'warnings_added') == []
+    assert actions(policy, stats(warnings_added=6), 'warnings_added') == ['mute']
+
+
+def test_chain_counts_the_action_it_adds(policy):
+    # 세 번째 재갈이 경고 누적으로 생기면 추방까지, 그 추방이 두 번째면 사형까지 이어진다
+    assert actions(policy, stats(warnings_added=3, mutes=2), 'warnings_added') == ['mute', 'kick']
+    assert actions(policy, stats(warnings_added=3, mutes=2, kicks=1), 'warnings_added') == ['mute', 'kick', 'ban']
+    assert actions(policy, stats(warnings_added=3, mutes=1, kicks=1), 'warnings_added') == ['mute']
+
+
+def test_direct_counter_uses_stored_value(policy):
+    # 명령어가 이미 올린 카운터는 그대로 본다
+    assert actions(policy, stats(kicks=2), 'kicks') == ['ban']
+    assert actions(policy, stats(mutes=3), 'mutes') == ['kick']
+    assert actions(policy, stats(bans=1), 'bans') == []
+
+
+def test_cycle_stops(main):
+    rules = [
+        main.EscalationRule('mutes', 1, 'kick', "r", "m"),
+        main.EscalationRule('kicks', 1, 'mute', "r", "m", timedelta(hours=1)),
+    ]
+    policy = main.EscalationPolicy(rules)
+    assert actions(policy, stats(mutes=1), 'mutes') == ['kick', 'mute']
+
+
+def rule_doc(**overrides):
+    doc = {'counter': 'warnings_added', 'every': 2, 'action': 'mute', 'reason': "r", 'message': "m",
+           'duration': 3600}
+    doc.update(overrides)
+    return doc
+
+
+def test_from_doc_accepts_valid_rules(main):
+    config = main.GuildConfig.from_doc({'guild_id': 1, 'escalation': [rule_doc(), rule_doc(counter='mutes',
+                                                                                            action='ban')]})
+    assert [rule.action for rule in config.escalation.rules] == ['mute', 'ban']
+    assert config.escalation.rules[0].duration == timedelta(hours=1)
+
+
+@pytest.mark.parametrize("overrides", [
+    {'duration': None},
+    {'every': 0},
+    {'every': -1},
+    {'action': 'timeout'},
+])
+def test_from_doc_rejects_invalid_rules(main, overrides):
+    with pytest.raises(ValueError):
+        main.GuildConfig.from_doc({'guild_id': 1, 'escalation': [rule_doc(**overrides)]})
+
+
+def test_from_doc_keeps_empty_role_lists(main):
+    config = main.GuildConfig.from_doc({'guild_id': 1, 'admin_role_ids': [], 'mute_role_id': None})
+    assert config.admin_role_ids == frozenset()
+    assert config.mute_role_id is None
+    default = main.GuildConfig.from_doc({'guild_id': 1})
+    assert default.admin_role_ids == frozenset(main.ADMIN_ROLE_ID)
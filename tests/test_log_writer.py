@@ -0,0 +1,80 @@
+"""
+LogWriter 저널이 꺼졌다 켜져도 처벌 기록을 잃지 않는지 확인한다
+"""
+
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId, json_util
+
+from storage import MemoryStorage
+
+GUILD_ID = 10
+
+
+def make_event(user_id: int):
+    return {'_id': ObjectId(), 'guild_id': GUILD_ID, 'user_id': user_id, 'type': 'warning', 'action': 'add',
+            'timestamp': datetime(2024, 1, 1, 12, 0, 0)}
+
+
+def write_journal(main, path, docs):
+    with open(path, 'w', encoding='utf-8') as f:
+        for doc in docs:
+            f.write(json_util.dumps(doc, json_options=main.JOURNAL_JSON_OPTIONS) + "\n")
+
+
+async def stored_users(store):
+    return sorted([doc['user_id'] async for doc in store.iter_events(GUILD_ID)])
+
+
+def test_replays_leftover_before_first_write(main, tmp_path):
+    path = str(tmp_path / "events.journal")
+    # 지난 실행이 저장소에 쓰기 전에 꺼져서 남은 기록
+    write_journal(main, path, [make_event(1)])
+
+    async def scenario():
+        store = MemoryStorage()
+        writer = main.LogWriter(store, path, 100, 60)
+        # start() 전에 명령어가 먼저 기록을 남기는 경우
+        await writer.write(make_event(2))
+        await writer.flush()
+        await writer.start()
+        await writer.close()
+        return await stored_users(store), writer._read_journal()
+
+    users, journal = asyncio.run(scenario())
+    assert users == [1, 2]
+    assert journal == []
+
+
+def test_start_replays_without_duplicates(main, tmp_path):
+    path = str(tmp_path / "events.journal")
+    leftover = [make_event(1), make_event(2)]
+    write_journal(main, path, leftover)
+
+    async def scenario():
+        store = MemoryStorage()
+        # 첫 번째 기록은 꺼지기 직전에 저장소까지 들어갔다
+        await store.insert_events(leftover[:1])
+        writer = main.LogWriter(store, path, 100, 60)
+        await writer.start()
+        await writer.close()
+        return await stored_users(store)
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_truncated_last_line_is_skipped(main, tmp_path):
+    path = str(tmp_path / "events.journal")
+    write_journal(main, path, [make_event(1)])
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"_id": {"$oid": "')
+
+    async def scenario():
+        store = MemoryStorage()
+        writer = main.LogWriter(store, path, 100, 60)
+        await writer.start()
+        await writer.close()
+        return await stored_users(store)
+
+    assert asyncio.run(scenario()) == [1]
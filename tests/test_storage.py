@@ -0,0 +1,155 @@
+"""
+MemoryStorage와 SqliteStorage가 같은 입력에 같은 결과를 내는지 확인한다
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from storage import MemoryStorage, SqliteStorage, Storage
+
+GUILD_ID = 10
+OTHER_GUILD_ID = 20
+USER_ID = 1
+# 같은 밀리초 안에서 마이크로초만 다른 기록이 섞이도록 한다
+BASE_TIME = datetime(2024, 1, 1, 12, 0, 0, 123456)
+
+
+def make_events():
+    events = []
+    for i in range(12):
+        events.append({
+            '_id': ObjectId(),
+            'guild_id': GUILD_ID if i % 4 else OTHER_GUILD_ID,
+            'user_id': USER_ID,
+            'type': 'warning' if i % 3 else 'mute',
+            'action': 'add',
+            'reason': f"사유 {i}",
+            'timestamp': BASE_TIME + timedelta(microseconds=300 * (i // 2), seconds=i // 4),
+        })
+    return events
+
+
+@pytest.fixture
+def backends(tmp_path):
+    sqlite = SqliteStorage(str(tmp_path / "storage.sqlite3"))
+    return [MemoryStorage(), sqlite]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def ids(docs):
+    return [doc['_id'] for doc in docs]
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+def test_event_pages_match(backends):
+    events = make_events()
+    results = []
+    for store in backends:
+        async def scenario():
+            await store.insert_events(events)
+            # 저널 재실행처럼 같은 _id를 다시 넣어도 무시한다
+            await store.insert_events(events[:3])
+            pages = [await store.event_page(GUILD_ID, USER_ID, 'warning', None, None, 2)]
+            while True:
+                page = await store.event_page(GUILD_ID, USER_ID, 'warning',
+                                              (pages[-1][-1]['timestamp'], pages[-1][-1]['_id']), None, 2)
+                if not page:
+                    break
+                pages.append(page)
+            # ◀️ 로 돌아가면 앞 페이지가 그대로 나와야 한다
+            back = await store.event_page(GUILD_ID, USER_ID, 'warning', None,
+                                          (pages[1][0]['timestamp'], pages[1][0]['_id']), 2)
+            recent = await store.recent_events(GUILD_ID, USER_ID, 2)
+            other = await store.event_page(OTHER_GUILD_ID, USER_ID, None, None, None, 10)
+            iterated = await collect(store.iter_events(GUILD_ID, USER_ID))
+            return pages, back, recent, other, iterated
+
+        results.append(run(scenario()))
+
+    memory, sqlite = results
+    assert [ids(page) for page in memory[0]] == [ids(page) for page in sqlite[0]]
+    assert ids(memory[1]) == ids(memory[0][0]) == ids(sqlite[1])
+    assert {key: ids(docs) for key, docs in memory[2].items()} == {key: ids(docs) for key, docs in sqlite[2].items()}
+    assert ids(memory[3]) == ids(sqlite[3])
+    assert all(doc['guild_id'] == OTHER_GUILD_ID for doc in memory[3])
+    assert [doc['type'] for doc in memory[4]] == [doc['type'] for doc in sqlite[4]]
+    # 저장된 시각은 BSON처럼 밀리초로 잘린다
+    assert all(doc['timestamp'].microsecond % 1000 == 0 for page in memory[0] for doc in page)
+    assert [page[0]['timestamp'] for page in memory[0]] == [page[0]['timestamp'] for page in sqlite[0]]
+
+
+def test_stats_and_snapshots_match(backends):
+    results = []
+    for store in backends:
+        async def scenario():
+            await store.replace_stats({'guild_id': GUILD_ID, 'user_id': USER_ID, 'warnings': 2,
+                                       'events': {'warning': 2}})
+            bumped = await store.bump_stats(GUILD_ID, USER_ID, {'warnings': 1, 'events.warning': 1},
+                                            {'warnings': {'$lt': 3}})
+            refused = await store.bump_stats(GUILD_ID, USER_ID, {'warnings': 1}, {'warnings': {'$lt': 3}})
+            missing = await store.bump_stats(GUILD_ID, USER_ID + 1, {'warnings': 1})
+            # defaults가 있으면 없는 카운터를 만들어서 올린다
+            created = await store.bump_stats(GUILD_ID, USER_ID + 2, {'warnings': 1, 'events.warning': 1},
+                                             defaults={'warnings': 0, 'bans': 0, 'events.warning': 0,
+                                                       'events.mute': 0})
+            created = {key: created[key] for key in ('warnings', 'bans', 'events')}
+
+            await store.save_snapshot(GUILD_ID, USER_ID, {'roles': [1, 2], 'state': 'pending'})
+            unfinished = await collect(store.iter_unfinished_snapshots([GUILD_ID]))
+            claimed = await store.claim_snapshot(GUILD_ID, USER_ID)
+            await store.delete_snapshot(claimed)
+            after_delete = await store.claim_snapshot(GUILD_ID, USER_ID)
+
+            stats = await store.get_stats(GUILD_ID, USER_ID)
+            return ({key: bumped[key] for key in ('warnings', 'events')}, refused, missing, created,
+                    [doc['roles'] for doc in unfinished], claimed['state'], after_delete,
+                    {key: stats[key] for key in ('warnings', 'events')})
+
+        results.append(run(scenario()))
+
+    assert results[0] == results[1]
+    assert results[0][0] == {'warnings': 3, 'events': {'warning': 3}}
+    assert results[0][3] == {'warnings': 1, 'bans': 0, 'events': {'warning': 1, 'mute': 0}}
+
+
+def test_mute_tasks_match(backends):
+    cutoff = BASE_TIME + timedelta(minutes=5)
+    results = []
+    for store in backends:
+        async def scenario():
+            for user_id in range(5):
+                await store.save_mute_task(GUILD_ID, user_id, {'end_time': BASE_TIME + timedelta(minutes=user_id * 2)})
+            await store.save_mute_task(OTHER_GUILD_ID, 0, {'end_time': BASE_TIME})
+            await store.delete_mute_task(GUILD_ID, 0)
+
+            expired, after = [], None
+            while True:
+                batch = await store.expired_mute_tasks(cutoff, [GUILD_ID], after, 1)
+                if not batch:
+                    break
+                expired += batch
+                after = (batch[-1]['end_time'], batch[-1]['_id'])
+            task = await store.get_mute_task(GUILD_ID, 1)
+            every = await collect(store.iter_mute_tasks())
+            return ([(doc['guild_id'], doc['user_id']) for doc in expired], task['end_time'],
+                    sorted((doc['guild_id'], doc['user_id']) for doc in every))
+
+        results.append(run(scenario()))
+
+    assert results[0] == results[1]
+    assert results[0][0] == [(GUILD_ID, 1), (GUILD_ID, 2)]
+    assert results[0][1].microsecond % 1000 == 0